@@ -1,20 +1,745 @@
-from typing import Sequence, TypeVar
+import heapq
+import math
+import os
+import pickle
+import shutil
+import tempfile
+from bisect import bisect_left, bisect_right, insort_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain, islice
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+from typing import IO, Any, Callable, Generic, Iterable, Iterator, Sequence, TypeVar
+
+import numpy as np
+import numpy.typing as npt
 
 
 T = TypeVar('T')
 
 
-def organise_sequence(values: Sequence[T]) -> list[T]:
+_ARRAY_SORT_MIN_SIZE = 64
+"""Shortest input worth converting to an array before sorting."""
+
+
+def _as_sortable_array(values: Sequence[T]) -> np.ndarray | None:
+    """Return `values` as a NumPy array if it sorts the same way as a list.
+
+    Only exact ints which fit a 64 bit integer type, floats
+    without NaN, and bytes without trailing null characters (which NumPy
+    drops) qualify. Bytes are also skipped when the longest value is much
+    longer than the average, as every value is padded to the longest. str
+    is left to `sorted`, which is as fast as NumPy's fixed width strings.
+    Anything else, including mixed types and subclasses, returns None.
+    """
+    if not values:
+        return None
+    value_type = type(values[0])
+    if value_type not in (int, float, bytes):
+        return None
+    if not all(type(value) is value_type for value in values):
+        return None
+
+    if value_type is float and any(value != value for value in values):
+        return None
+    if value_type is bytes:
+        if any(value.endswith(b'\0') for value in values):
+            return None
+        lengths = [len(value) for value in values]
+        if max(lengths) > 2 * sum(lengths) / len(lengths) + 16:
+            return None
+
+    try:
+        array = np.array(values)
+        # NumPy infers float64 for ints spanning int64 and uint64, losing
+        # precision, so retry unsigned when none are negative.
+        if value_type is int and array.dtype.kind not in 'iu' and min(values) >= 0:
+            array = np.array(values, dtype=np.uint64)
+    except OverflowError:
+        return None
+    if value_type is int and array.dtype.kind not in 'iu':
+        return None
+    if array.dtype == object:
+        return None
+    return array
+
+
+def _as_object_array(values: list[T]) -> np.ndarray:
+    """Return a one dimensional object array, even if values are sequences."""
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+@dataclass(frozen=True)
+class SortKey:
+    """One column of a multi-key sort.
+
+    Attributes
+    ----------
+    func
+        Function computing the key of each value.
+    descending
+        Whether this key is sorted from largest to smallest.
+    """
+
+    func: Callable[[Any], Any]
+    descending: bool = False
+
+
+def _dense_ranks(
+    column: list[Any],
+    descending: bool,
+) -> tuple[np.ndarray, int] | None:
+    """Replace each key with its rank among the distinct keys.
+
+    Returns the ranks and the number of distinct keys, or None if the keys
+    cannot be held in a NumPy array.
+    """
+    array = _as_sortable_array(column)
+    if array is None:
+        return None
+    distinct, ranks = np.unique(array, return_inverse=True)
+    if descending:
+        ranks = len(distinct) - 1 - ranks
+    return ranks.astype(np.int64), len(distinct)
+
+
+def _key_order(values: Sequence[T], keys: Sequence[SortKey]) -> list[int]:
+    """Return the positions of `values` in order of `keys`.
+
+    Each key is computed once per value. When every key column can be held
+    in a NumPy array, the columns are reduced to ranks and packed into one
+    integer per value, so sorting needs no Python comparisons at all.
+    Otherwise the positions are sorted once per key, least significant
+    first, which relies on each sort being stable.
+    """
+    columns = [[key.func(value) for value in values] for key in keys]
+
+    ranked = [
+        _dense_ranks(column, key.descending)
+        for column, key in zip(columns, keys)
+    ]
+    if None in ranked:
+        order = list(range(len(values)))
+        for column, key in reversed(list(zip(columns, keys))):
+            order.sort(key=column.__getitem__, reverse=key.descending)
+        return order
+
+    if math.prod(size for _, size in ranked) < 2**63:
+        packed = np.zeros(len(values), dtype=np.int64)
+        for ranks, size in ranked:
+            packed = packed * size + ranks
+        return np.argsort(packed, kind='stable').tolist()
+    # np.lexsort treats its last column as the most significant.
+    return np.lexsort([ranks for ranks, _ in reversed(ranked)]).tolist()
+
+
+def organise_sequence(
+    values: Sequence[T],
+    as_array: bool = False,
+    key: Callable[[T], Any] | SortKey | Sequence[SortKey] | None = None,
+) -> list[T] | np.ndarray:
     """Sort the provided sequence.
 
+    Sequences of only ints, floats or bytes are sorted as a NumPy array,
+    which avoids comparing each pair as Python objects. Any other input is
+    sorted with `sorted`, and both give the same result.
+
     Parameters
     ----------
     values
         A sequence of values to be sorted, should all be same type.
+    as_array
+        Return the sorted values as a NumPy array, skipping the conversion
+        back to a list. Values not sorted as an array are returned in a one
+        dimensional object array.
+    key
+        Function computing the key to sort each value by, a `SortKey`, or a
+        sequence of `SortKey` from most to least significant. Each key is computed
+        exactly once per value, and equal keys keep their input order.
+
+    Returns
+    -------
+    list[T] | np.ndarray
+        The sorted values, as an array if `as_array` is set.
+
+    Examples
+    --------
+    >>> organise_sequence(
+    ...     [('b', 1), ('a', 2), ('b', 2)],
+    ...     key=[SortKey(lambda r: r[1], descending=True), SortKey(lambda r: r[0])],
+    ... )
+    [('a', 2), ('b', 2), ('b', 1)]
+    """
+    if key is not None:
+        values = list(values)
+        if isinstance(key, SortKey):
+            keys = [key]
+        elif callable(key):
+            keys = [SortKey(key)]
+        else:
+            keys = list(key)
+        result = [values[i] for i in _key_order(values, keys)]
+        return _as_object_array(result) if as_array else result
+
+    array = None
+    if isinstance(values, (list, tuple)) and (
+        as_array or len(values) >= _ARRAY_SORT_MIN_SIZE
+    ):
+        array = _as_sortable_array(values)
+
+    if array is None:
+        result = sorted(values)
+        return _as_object_array(result) if as_array else result
+
+    array = np.sort(array, kind='stable')
+    return array if as_array else array.tolist()
+
+
+def organise_sequence_topk(values: Iterable[T], k: int) -> list[T]:
+    """Return the `k` smallest values in sorted order.
+
+    Uses a heap of size `k`, which is O(n log k) rather than sorting all
+    the values. The result equals `organise_sequence(values)[:k]`.
+
+    Parameters
+    ----------
+    values
+        Any iterable of values, should all be same type.
+    k
+        Number of values to return.
 
     Returns
     -------
     list[T]
+        The first `k` sorted values, or all of them if there are fewer.
+    """
+    return heapq.nsmallest(k, values)
+
+
+def iter_sorted(values: Iterable[T]) -> Iterator[T]:
+    """Yield the values in sorted order, doing the work lazily.
+
+    The values are heapified in O(n) up front and each value yielded costs
+    O(log n), so a consumer which stops after `m` values pays O(n + m log n)
+    rather than for a full sort. Equal values keep their input order, as
+    with `organise_sequence`.
+
+    Parameters
+    ----------
+    values
+        Any iterable of values, should all be same type.
+
+    Yields
+    ------
+    T
+        The sorted values.
+    """
+    # The position breaks ties so equal values come out in input order.
+    heap = [(value, position) for position, value in enumerate(values)]
+    heapq.heapify(heap)
+    while heap:
+        yield heapq.heappop(heap)[0]
+
+
+def _write_run(run: list[T], directory: str | None, block_size: int) -> IO[bytes]:
+    """Spill a sorted run to a temporary file, in pickled blocks."""
+    file = tempfile.TemporaryFile(dir=directory)
+    for start in range(0, len(run), block_size):
+        pickle.dump(
+            run[start:start + block_size], file, protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    file.seek(0)
+    return file
+
+
+def _read_run(file: IO[bytes]) -> Iterator[T]:
+    """Read a run back from its file one block at a time."""
+    while True:
+        try:
+            block = pickle.load(file)
+        except EOFError:
+            return
+        yield from block
+
+
+def organise_sequence_external(
+    values: Iterable[T],
+    run_size: int = 100_000,
+    directory: str | None = None,
+    block_size: int = 1024,
+) -> Iterator[T]:
+    """Sort values which may not fit in memory, yielding them in order.
+
+    The input is read in runs of `run_size` values. Each run is sorted and
+    spilled to a temporary file, and the files are then merged back
+    together. At most one run, plus one block per spilled run during the
+    merge, is held in memory at a time. The order matches
+    `organise_sequence`, including the order of equal values.
+
+    Parameters
+    ----------
+    values
+        Any iterable of values to be sorted, should all be same type and
+        picklable.
+    run_size
+        Number of values sorted in memory at once.
+    directory
+        Where to create the temporary files, defaults to the system temp
+        directory.
+    block_size
+        Number of values per pickled block in the temporary files.
+
+    Yields
+    ------
+    T
         The sorted values.
+
+    Raises
+    ------
+    ValueError
+        If `run_size` or `block_size` is less than 1.
     """
-    return sorted(values)
+    if run_size < 1 or block_size < 1:
+        raise ValueError(
+            f'run_size and block_size must be at least 1, '
+            f'got {run_size=} and {block_size=}.'
+        )
+
+    iterator = iter(values)
+    files: list[IO[bytes]] = []
+    try:
+        while run := sorted(islice(iterator, run_size)):
+            if not files and len(run) < run_size:
+                # Everything fitted in one run, so nothing needs spilling.
+                yield from run
+                return
+            files.append(_write_run(run, directory, block_size))
+            del run
+
+        # heapq.merge is stable, so equal values keep their input order.
+        yield from heapq.merge(*(_read_run(file) for file in files))
+    finally:
+        for file in files:
+            file.close()
+
+
+def _sort_shared_partition(
+    name: str,
+    dtype: str,
+    size: int,
+    start: int,
+    stop: int,
+) -> None:
+    """Sort elements `start` to `stop` of the shared array in a worker."""
+    memory = SharedMemory(name=name)
+    try:
+        array = np.ndarray(size, dtype=dtype, buffer=memory.buf)
+        array[start:stop].sort(kind='stable')
+        # The array must be released before the memory can be closed.
+        del array
+    finally:
+        memory.close()
+
+
+def organise_sequence_parallel(
+    values: Sequence[T],
+    max_workers: int | None = None,
+    min_size: int = 10_000_000,
+    oversample: int = 32,
+    mp_context: BaseContext | None = None,
+) -> list[T]:
+    """Sort the provided sequence using several processes.
+
+    A sample sort over a NumPy array: splitters are taken from a sorted
+    sample of the values, each value is placed in the partition between two
+    splitters with `np.searchsorted`, and the partitions are laid out one
+    after another in shared memory, where each process sorts its own
+    partition in place. Equal values always land in the same partition in
+    their input order, so the result is identical to `organise_sequence`,
+    including stability.
+
+    Only sequences `organise_sequence` would sort as an array, of ints,
+    floats or bytes, are sorted in parallel. Anything else would have to be
+    pickled to and from the processes, which costs as much as sorting it,
+    so is sorted in this process instead.
+
+    Parameters
+    ----------
+    values
+        A sequence of values to be sorted, should all be same type.
+    max_workers
+        Maximum number of processes, defaults to the number of CPUs.
+    min_size
+        Sequences shorter than this, or runs with a single worker, are
+        sorted in this process. Only `np.sort` runs in parallel, while
+        converting to and from an array and partitioning do not, so below
+        several million values the pool costs more than it saves.
+    oversample
+        Number of sampled values per partition used to choose splitters.
+    mp_context
+        Multiprocessing context, passed to `ProcessPoolExecutor`.
+
+    Returns
+    -------
+    list[T]
+        The sorted values.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if len(values) < max(min_size, 2) or workers < 2:
+        return organise_sequence(values)
+    array = _as_sortable_array(values)
+    if array is None:
+        return organise_sequence(values)
+
+    step = max(len(array) // (workers * oversample), 1)
+    sample = np.sort(array[::step])
+    splitters = sample[len(sample) * np.arange(1, workers) // workers]
+    # Partition numbers of a byte or two get a linear time radix sort.
+    partition = np.searchsorted(splitters, array, side='right').astype(
+        np.min_scalar_type(workers),
+    )
+    sizes = np.bincount(partition, minlength=workers)
+    bounds = np.concatenate(([0], np.cumsum(sizes))).tolist()
+
+    memory = SharedMemory(create=True, size=array.nbytes)
+    try:
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        np.take(array, np.argsort(partition, kind='stable'), out=shared)
+
+        with ProcessPoolExecutor(workers, mp_context=mp_context) as executor:
+            futures = [
+                executor.submit(
+                    _sort_shared_partition,
+                    memory.name,
+                    array.dtype.str,
+                    len(array),
+                    start,
+                    stop,
+                )
+                for start, stop in zip(bounds, bounds[1:])
+                if stop > start
+            ]
+            for future in futures:
+                future.result()
+
+        result = shared.tolist()
+        del shared
+        return result
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+class SortedSequence(Generic[T]):
+    """A collection which keeps its values in `organise_sequence` order.
+
+    Values are held in a list of sorted chunks of around `load` values, with
+    the largest value of each chunk kept alongside. Finding a value is a
+    bisect over the chunk maxima then within one chunk, and inserting only
+    shifts the values of that chunk, so each update stays cheap and cache
+    friendly even with millions of values. Equal values are kept in the
+    order they were added, so the contents always equal
+    `organise_sequence` of everything added so far.
+
+    Examples
+    --------
+    >>> values = SortedSequence([5, 1, 3])
+    >>> values.add(2)
+    >>> list(values)
+    [1, 2, 3, 5]
+    >>> list(values.irange(2, 4))
+    [2, 3]
+    """
+
+    def __init__(self, values: Iterable[T] = (), load: int = 1000):
+        """Initialise the collection.
+
+        Parameters
+        ----------
+        values
+            Initial values, in any order.
+        load
+            Target number of values per chunk. Chunks are split when they
+            reach twice this size.
+        """
+        if load < 1:
+            raise ValueError(f'load must be at least 1, got {load=}.')
+        self._load = load
+        self._set_values(sorted(values))
+
+    def _set_values(self, values: list[T]) -> None:
+        """Replace the contents with already sorted `values`."""
+        self._chunks = [
+            values[start:start + self._load]
+            for start in range(0, len(values), self._load)
+        ]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(values)
+        self._offsets: list[int] | None = None
+
+    def _offset(self, chunk: int) -> int:
+        """Number of values held in the chunks before `chunk`."""
+        if self._offsets is None:
+            self._offsets = [0]
+            for values in self._chunks:
+                self._offsets.append(self._offsets[-1] + len(values))
+        return self._offsets[chunk]
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[T]:
+        return chain.from_iterable(self._chunks)
+
+    def __reversed__(self) -> Iterator[T]:
+        for chunk in reversed(self._chunks):
+            yield from reversed(chunk)
+
+    def __contains__(self, value: T) -> bool:
+        chunk = bisect_left(self._maxes, value)
+        if chunk == len(self._chunks):
+            return False
+        values = self._chunks[chunk]
+        position = bisect_left(values, value)
+        return position < len(values) and not value < values[position]
+
+    def __getitem__(self, index: int) -> T:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('SortedSequence index out of range')
+        self._offset(0)
+        chunk = bisect_right(self._offsets, index) - 1
+        return self._chunks[chunk][index - self._offsets[chunk]]
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({list(self)!r})'
+
+    def add(self, value: T) -> None:
+        """Insert `value` after any values equal to it."""
+        self._offsets = None
+        self._len += 1
+        if not self._chunks:
+            self._chunks.append([value])
+            self._maxes.append(value)
+            return
+
+        chunk = bisect_right(self._maxes, value)
+        if chunk == len(self._chunks):
+            chunk -= 1
+            self._chunks[chunk].append(value)
+            self._maxes[chunk] = value
+        else:
+            insort_right(self._chunks[chunk], value)
+
+        values = self._chunks[chunk]
+        if len(values) >= 2 * self._load:
+            self._chunks[chunk:chunk + 1] = [
+                values[:self._load], values[self._load:],
+            ]
+            self._maxes[chunk:chunk + 1] = [values[self._load - 1], values[-1]]
+
+    def remove(self, value: T) -> None:
+        """Remove the first value equal to `value`.
+
+        Raises
+        ------
+        ValueError
+            If no value is equal to `value`.
+        """
+        chunk = bisect_left(self._maxes, value)
+        if chunk < len(self._chunks):
+            values = self._chunks[chunk]
+            position = bisect_left(values, value)
+            if position < len(values) and not value < values[position]:
+                del values[position]
+                self._offsets = None
+                self._len -= 1
+                if values:
+                    self._maxes[chunk] = values[-1]
+                else:
+                    del self._chunks[chunk]
+                    del self._maxes[chunk]
+                return
+        raise ValueError(f'{value!r} not in SortedSequence')
+
+    def bisect_left(self, value: T) -> int:
+        """Index at which `value` would be inserted before equal values."""
+        chunk = bisect_left(self._maxes, value)
+        if chunk == len(self._chunks):
+            return self._len
+        return self._offset(chunk) + bisect_left(self._chunks[chunk], value)
+
+    def bisect_right(self, value: T) -> int:
+        """Index at which `value` would be inserted after equal values."""
+        chunk = bisect_right(self._maxes, value)
+        if chunk == len(self._chunks):
+            return self._len
+        return self._offset(chunk) + bisect_right(self._chunks[chunk], value)
+
+    def irange(
+        self,
+        minimum: T | None = None,
+        maximum: T | None = None,
+        inclusive: tuple[bool, bool] = (True, True),
+    ) -> Iterator[T]:
+        """Yield the values between `minimum` and `maximum` in order.
+
+        Parameters
+        ----------
+        minimum
+            Lower bound, or None for no lower bound.
+        maximum
+            Upper bound, or None for no upper bound.
+        inclusive
+            Whether each bound is included in the range.
+
+        Yields
+        ------
+        T
+            The values in the range.
+        """
+        if minimum is None:
+            start = 0
+        elif inclusive[0]:
+            start = self.bisect_left(minimum)
+        else:
+            start = self.bisect_right(minimum)
+
+        if maximum is None:
+            stop = self._len
+        elif inclusive[1]:
+            stop = self.bisect_right(maximum)
+        else:
+            stop = self.bisect_left(maximum)
+
+        return self._iter_between(start, stop)
+
+    def _iter_between(self, start: int, stop: int) -> Iterator[T]:
+        """Yield the values from index `start` up to `stop`."""
+        if start >= stop:
+            return
+        self._offset(0)
+        chunk = bisect_right(self._offsets, start) - 1
+        position = start - self._offsets[chunk]
+        remaining = stop - start
+        while remaining > 0:
+            values = self._chunks[chunk][position:position + remaining]
+            yield from values
+            remaining -= len(values)
+            chunk += 1
+            position = 0
+
+    def update(self, values: Sequence[T]) -> None:
+        """Merge a batch of already sorted values in O(n + m).
+
+        Values equal to ones already held are placed after them, as if each
+        had been added in turn.
+
+        Raises
+        ------
+        ValueError
+            If `values` is not sorted.
+        """
+        if any(b < a for a, b in zip(values, islice(values, 1, None))):
+            raise ValueError('values must already be sorted.')
+        self._set_values(list(heapq.merge(self, values)))
+
+
+def organise_record_file(
+    path: str | os.PathLike,
+    record_size: int,
+    key_offset: int,
+    key_dtype: npt.DTypeLike,
+    output_path: str | os.PathLike | None = None,
+    chunk_size: int = 1_000_000,
+) -> None:
+    """Sort a file of fixed-width binary records by a key within each record.
+
+    The file is memory-mapped and the keys are read as a strided NumPy view,
+    so no Python object is created per record. Only the sort order, eight
+    bytes per record, is held in memory while the records are copied to
+    the output in chunks. Records with equal keys keep their order.
+
+    Parameters
+    ----------
+    path
+        File of records to sort.
+    record_size
+        Size of each record in bytes.
+    key_offset
+        Byte offset of the key within each record.
+    key_dtype
+        NumPy dtype of the key, e.g. '<i8' or 'S16'. Give the byte order
+        explicitly for numeric keys written on another platform.
+    output_path
+        File to write the sorted records to. If None, or the same file as
+        `path`, `path` is replaced by the sorted file once it is complete,
+        keeping its permissions.
+    chunk_size
+        Number of records copied at a time.
+
+    Raises
+    ------
+    ValueError
+        If the key does not fit in a record, or the file is not a whole
+        number of records.
+    """
+    key_dtype = np.dtype(key_dtype)
+    if key_offset < 0 or key_offset + key_dtype.itemsize > record_size:
+        raise ValueError(
+            f'A {key_dtype} key at {key_offset=} does not fit in '
+            f'{record_size=}.'
+        )
+    file_size = os.path.getsize(path)
+    if file_size % record_size:
+        raise ValueError(
+            f'File size {file_size} is not a multiple of {record_size=}.'
+        )
+
+    if output_path is not None and os.path.exists(output_path) and (
+        os.path.samefile(path, output_path)
+    ):
+        # Writing over the records while reading them would lose them.
+        output_path = None
+    if output_path is None:
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, target = tempfile.mkstemp(dir=directory)
+        os.close(descriptor)
+    else:
+        target = output_path
+
+    count = file_size // record_size
+    record_dtype = np.dtype((np.void, record_size))
+    try:
+        if count == 0:
+            # Zero length files cannot be memory-mapped.
+            open(target, 'wb').close()
+        else:
+            records = np.memmap(path, dtype=record_dtype, mode='r')
+            keys = records.view(np.dtype({
+                'names': ['key'],
+                'formats': [key_dtype],
+                'offsets': [key_offset],
+                'itemsize': record_size,
+            }))['key']
+            order = np.argsort(keys, kind='stable')
+            del keys
+
+            output = np.memmap(target, dtype=record_dtype, mode='w+', shape=count)
+            for start in range(0, count, chunk_size):
+                output[start:start + chunk_size] = (
+                    records[order[start:start + chunk_size]]
+                )
+            output.flush()
+            del records, output
+    except BaseException:
+        if output_path is None:
+            os.remove(target)
+        raise
+
+    if output_path is None:
+        # mkstemp creates the file readable by its owner only.
+        shutil.copymode(path, target)
+        os.replace(target, path)
@@ -1,9 +1,32 @@
-from datetime import datetime, timedelta
+import csv
+import json
+import os
+import re
+from collections import deque
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from itertools import islice
+from typing import IO, Hashable, Iterable, Iterator, Mapping, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+from zoneinfo import ZoneInfo
+
+
+K = TypeVar('K', bound=Hashable)
+
+
+def _to_utc(value: datetime, naive_timezone: tzinfo) -> datetime:
+    """Convert to naive UTC, reading naive values as `naive_timezone`."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=naive_timezone)
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 def calculate_datetime_delta(
     date1: datetime,
     date2: datetime,
+    naive_timezone: tzinfo | None = None,
 ) -> timedelta:
     """Calculate the difference between two datetime objects.
 
@@ -13,10 +36,521 @@ def calculate_datetime_delta(
         The first datetime object.
     date2
         The second datetime object.
+    naive_timezone
+        If given, both dates are converted to UTC before subtracting, with
+        naive dates read as local times in this zone. This allows naive and
+        aware dates to be mixed, and gives the elapsed time across DST
+        changes even when both dates share a zone, which plain subtraction
+        does not.
 
     Returns
     -------
     timedelta
         The difference between the two provided dates.
     """
+    if naive_timezone is not None:
+        date1 = _to_utc(date1, naive_timezone)
+        date2 = _to_utc(date2, naive_timezone)
     return date1 - date2
+
+
+def _as_datetime64(values: npt.ArrayLike | datetime) -> np.ndarray:
+    """Convert datetimes, datetime64 or Arrow timestamps to a datetime64 array.
+
+    Anything implementing the NumPy array protocol is converted without a
+    copy where possible, including pyarrow timestamp arrays. Python
+    datetime objects are converted at microsecond resolution.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind != 'M':
+        array = array.astype('datetime64[us]')
+    return array
+
+
+def calculate_datetime_delta_array(
+    date1: npt.ArrayLike | datetime,
+    date2: npt.ArrayLike | datetime,
+) -> np.ndarray:
+    """Calculate the differences between two arrays of datetimes.
+
+    Vectorised version of `calculate_datetime_delta`. Either argument may be
+    a single datetime, which is broadcast against the other.
+
+    Parameters
+    ----------
+    date1
+        The first datetimes, as a NumPy datetime64 array, a pyarrow
+        timestamp array, a sequence of datetime objects or a single
+        datetime.
+    date2
+        The second datetimes, in any of the same forms as `date1`.
+
+    Returns
+    -------
+    np.ndarray
+        timedelta64 array of the differences between the provided dates, at
+        the finer of the two input resolutions. Missing values give NaT.
+    """
+    return np.subtract(_as_datetime64(date1), _as_datetime64(date2))
+
+
+_NAT = np.datetime64('NaT', 'us').astype(np.int64)
+
+
+_NAIVE_ISO_FORMAT = re.compile(
+    r'\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?)?'
+)
+"""Naive ISO-8601 timestamps, which NumPy parses the same as Python."""
+
+
+class _TimestampParser:
+    """Parse ISO-8601 strings to datetime64[us], caching repeated strings.
+
+    Strings not yet in the cache which are plain naive ISO-8601 timestamps
+    are parsed together by NumPy's C parser. NumPy also accepts strings such
+    as 'now' and '2020', so anything else, including strings with a UTC
+    offset, is parsed one at a time with `datetime.fromisoformat`, which
+    raises ValueError for invalid strings, and converted to UTC. Empty
+    strings and None give NaT. The cache is emptied whenever it would grow
+    beyond `cache_size` strings.
+    """
+
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self.cache: dict[str | None, int] = {}
+
+    @staticmethod
+    def _parse_one(value: str | None) -> int:
+        if not value:
+            return _NAT
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(parsed, 'us').astype(np.int64)
+
+    def __call__(self, values: list[str | None]) -> np.ndarray:
+        cache = self.cache
+        # Looked up separately from the cache, which may be cleared below.
+        lookup = {}
+        missing = []
+        for value in set(values):
+            if value in cache:
+                lookup[value] = cache[value]
+            else:
+                missing.append(value)
+
+        if missing:
+            naive = [
+                value for value in missing
+                if value and _NAIVE_ISO_FORMAT.fullmatch(value)
+            ]
+            others = [
+                value for value in missing
+                if not (value and _NAIVE_ISO_FORMAT.fullmatch(value))
+            ]
+            try:
+                parsed = np.array(
+                    naive, dtype='datetime64[us]',
+                ).astype(np.int64).tolist()
+            except ValueError:
+                # Out of range fields, such as month 13.
+                parsed = [self._parse_one(value) for value in naive]
+            new = dict(zip(naive, parsed))
+            new.update((value, self._parse_one(value)) for value in others)
+            lookup.update(new)
+
+            if len(cache) + len(new) > self.cache_size:
+                cache.clear()
+            if len(new) <= self.cache_size:
+                cache.update(new)
+
+        microseconds = np.fromiter(
+            (lookup[value] for value in values), dtype=np.int64, count=len(values),
+        )
+        return microseconds.view('datetime64[us]')
+
+
+def _iter_datetime_deltas(
+    records: Iterable[Mapping[str, str | None]],
+    column1: str,
+    column2: str,
+    chunk_size: int,
+    cache_size: int,
+) -> Iterator[np.ndarray]:
+    """Yield the deltas between two timestamp columns, chunk by chunk."""
+    if chunk_size < 1:
+        raise ValueError(f'chunk_size must be at least 1, got {chunk_size=}.')
+    parse = _TimestampParser(cache_size)
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        yield calculate_datetime_delta_array(
+            parse([record[column1] for record in chunk]),
+            parse([record[column2] for record in chunk]),
+        )
+
+
+def iter_csv_datetime_deltas(
+    file: str | os.PathLike | IO[str],
+    column1: str,
+    column2: str,
+    chunk_size: int = 100_000,
+    cache_size: int = 1_000_000,
+) -> Iterator[np.ndarray]:
+    """Stream the deltas between two ISO-8601 columns of a CSV file.
+
+    Only one chunk of rows is held in memory at a time. Each distinct
+    timestamp string is parsed once, so columns with many repeated
+    timestamps cost little more than reading the file.
+
+    Parameters
+    ----------
+    file
+        Path or open text file of CSV data with a header row.
+    column1
+        Name of the column holding the first datetimes.
+    column2
+        Name of the column holding the second datetimes.
+    chunk_size
+        Number of rows per yielded array.
+    cache_size
+        Maximum number of distinct timestamp strings remembered.
+
+    Yields
+    ------
+    np.ndarray
+        timedelta64[us] array of `column1 - column2` for each chunk of rows.
+        Empty cells give NaT. Timestamps with a UTC offset are converted to
+        UTC, those without are taken as they are.
+
+    Raises
+    ------
+    KeyError
+        If `column1` or `column2` is not in the header row.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, newline='', encoding='utf-8') as opened:
+            yield from iter_csv_datetime_deltas(
+                opened, column1, column2, chunk_size, cache_size,
+            )
+        return
+    reader = csv.DictReader(file)
+    # An empty file has no header, and no rows to check the columns against.
+    if reader.fieldnames is not None:
+        for column in (column1, column2):
+            if column not in reader.fieldnames:
+                raise KeyError(f'Column {column!r} is not in the CSV header.')
+    yield from _iter_datetime_deltas(
+        reader, column1, column2, chunk_size, cache_size,
+    )
+
+
+def iter_jsonl_datetime_deltas(
+    file: str | os.PathLike | IO[str],
+    column1: str,
+    column2: str,
+    chunk_size: int = 100_000,
+    cache_size: int = 1_000_000,
+) -> Iterator[np.ndarray]:
+    """Stream the deltas between two ISO-8601 fields of a JSON lines file.
+
+    See `iter_csv_datetime_deltas`, which this mirrors for files holding one
+    JSON object per line. Null fields give NaT, while a missing field
+    raises KeyError.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, encoding='utf-8') as opened:
+            yield from iter_jsonl_datetime_deltas(
+                opened, column1, column2, chunk_size, cache_size,
+            )
+        return
+    yield from _iter_datetime_deltas(
+        (json.loads(line) for line in file if line.strip()),
+        column1,
+        column2,
+        chunk_size,
+        cache_size,
+    )
+
+
+def iter_consecutive_deltas(
+    events: Iterable[tuple[K, datetime]],
+) -> Iterator[tuple[K, datetime, timedelta | None]]:
+    """Yield the gap between each event and the previous one for its key.
+
+    A single pass over the events, keeping only the last timestamp seen for
+    each key.
+
+    Parameters
+    ----------
+    events
+        Pairs of key and timestamp, in time order within each key.
+
+    Yields
+    ------
+    tuple[K, datetime, timedelta | None]
+        The key, timestamp and the gap since the previous event for the key,
+        or None for its first event.
+
+    Raises
+    ------
+    ValueError
+        If an event is earlier than the previous event for its key.
+    """
+    previous: dict[K, datetime] = {}
+    for key, timestamp in events:
+        last = previous.get(key)
+        delta = None if last is None else calculate_datetime_delta(timestamp, last)
+        if delta is not None and delta < timedelta(0):
+            raise ValueError(f'Events for {key=} are not in time order.')
+        previous[key] = timestamp
+        yield key, timestamp, delta
+
+
+class _RollingWindow:
+    """State for one key: recent timestamps and a deque of candidate max gaps."""
+
+    def __init__(self, size: int):
+        self.timestamps: deque[datetime] = deque(maxlen=size)
+        # Gaps which may still be the maximum, as (event number, gap), with
+        # gaps decreasing from left to right.
+        self.gaps: deque[tuple[int, timedelta]] = deque()
+        self.count = 0
+
+
+def iter_rolling_deltas(
+    events: Iterable[tuple[K, datetime]],
+    window: int,
+) -> Iterator[tuple[K, datetime, timedelta, timedelta | None]]:
+    """Yield rolling spans and maximum gaps over the last `window` events.
+
+    A single pass over the events. The state kept per key is bounded by the
+    window, not the length of the stream: its last `window` timestamps and
+    a monotonic deque giving the maximum gap in amortised O(1) per event.
+
+    Parameters
+    ----------
+    events
+        Pairs of key and timestamp, in time order within each key.
+    window
+        Number of events, including the current one, in each window.
+
+    Yields
+    ------
+    tuple[K, datetime, timedelta, timedelta | None]
+        The key, timestamp, the span from the earliest to the latest event
+        in the window, and the largest gap between consecutive events in the
+        window, or None if the window holds a single event.
+
+    Raises
+    ------
+    ValueError
+        If `window` is less than 1, or an event is earlier than the
+        previous event for its key.
+    """
+    if window < 1:
+        raise ValueError(f'window must be at least 1, got {window=}.')
+
+    states: dict[K, _RollingWindow] = {}
+    for key, timestamp, delta in iter_consecutive_deltas(events):
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _RollingWindow(window)
+        state.timestamps.append(timestamp)
+        state.count += 1
+
+        if delta is not None:
+            while state.gaps and state.gaps[-1][1] <= delta:
+                state.gaps.pop()
+            state.gaps.append((state.count, delta))
+        # A window of `window` events holds the gaps ending at its last
+        # `window - 1` events.
+        while state.gaps and state.gaps[0][0] <= state.count - window + 1:
+            state.gaps.popleft()
+
+        span = calculate_datetime_delta(timestamp, state.timestamps[0])
+        max_gap = state.gaps[0][1] if state.gaps else None
+        yield key, timestamp, span, max_gap
+
+
+def consecutive_deltas_array(
+    keys: npt.ArrayLike,
+    timestamps: npt.ArrayLike,
+) -> np.ndarray:
+    """Vectorised gaps between each event and the previous one for its key.
+
+    Parameters
+    ----------
+    keys
+        Key of each event.
+    timestamps
+        Timestamp of each event, in any form accepted by
+        `calculate_datetime_delta_array`, in time order within each key.
+
+    Returns
+    -------
+    np.ndarray
+        timedelta64 array aligned with the inputs, NaT for the first event
+        of each key.
+
+    Raises
+    ------
+    ValueError
+        If an event is earlier than the previous event for its key.
+    """
+    keys = np.asarray(keys)
+    timestamps = _as_datetime64(timestamps)
+    # A stable sort by key keeps each key's events in time order.
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sorted_times = timestamps[order]
+
+    gaps = np.diff(sorted_times)
+    same_key = sorted_keys[1:] == sorted_keys[:-1]
+    if np.any(gaps[same_key] < np.timedelta64(0)):
+        raise ValueError('Events are not in time order within each key.')
+    deltas = np.full(len(order), np.timedelta64('NaT'), dtype=gaps.dtype)
+    deltas[1:][same_key] = gaps[same_key]
+
+    result = np.empty_like(deltas)
+    result[order] = deltas
+    return result
+
+
+@lru_cache(maxsize=256)
+def _offset_table(
+    zone: tzinfo,
+    first_year: int,
+    last_year: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Local time boundaries and UTC offsets, in seconds, for a zone.
+
+    The offset is sampled daily and each change is narrowed down to the
+    second by bisection. Entry `i` of the offsets applies to local times
+    from boundary `i`. Around a transition the boundary follows `fold=0`:
+    times in a gap use the offset from before it, and ambiguous times the
+    earlier of their two readings, as Python does.
+    """
+    def offset_at(seconds: int) -> int:
+        utc = datetime.fromtimestamp(seconds, timezone.utc)
+        return int(zone.utcoffset(utc.astimezone(zone)).total_seconds())
+
+    start = int(datetime(first_year, 1, 1, tzinfo=timezone.utc).timestamp())
+    stop = int(datetime(last_year + 1, 1, 1, tzinfo=timezone.utc).timestamp())
+    day = 86_400
+
+    current = offset_at(start)
+    boundaries = [np.iinfo(np.int64).min]
+    offsets = [current]
+    for seconds in range(start + day, stop + day, day):
+        offset = offset_at(seconds)
+        if offset == current:
+            continue
+        low, high = seconds - day, seconds
+        while high - low > 1:
+            middle = (low + high) // 2
+            if offset_at(middle) == current:
+                low = middle
+            else:
+                high = middle
+        boundaries.append(high + max(current, offset))
+        offsets.append(offset)
+        current = offset
+    return np.array(boundaries, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def _as_zone(zone: str | tzinfo) -> tzinfo:
+    return ZoneInfo(zone) if isinstance(zone, str) else zone
+
+
+def localize_to_utc(
+    timestamps: npt.ArrayLike,
+    zone: str | tzinfo | npt.ArrayLike,
+) -> np.ndarray:
+    """Convert local wall clock times to UTC, vectorised over arrays.
+
+    Each zone's UTC offsets are worked out once into a cached table of
+    transitions, which is then applied to the whole array with a single
+    `np.searchsorted`, so no Python object is created per value. Times in a
+    DST gap or overlap are resolved as Python does with `fold=0`.
+
+    Parameters
+    ----------
+    timestamps
+        Naive local times, in any form accepted by
+        `calculate_datetime_delta_array`.
+    zone
+        A zone name such as 'Europe/London', a tzinfo, or an array of zone
+        names aligned with `timestamps` for data spanning several zones.
+
+    Returns
+    -------
+    np.ndarray
+        datetime64[s] or finer array of the same instants in UTC.
+    """
+    timestamps = _as_datetime64(timestamps)
+    timestamps = timestamps.astype(
+        np.promote_types(timestamps.dtype, 'datetime64[s]'),
+    )
+
+    if isinstance(zone, (str, tzinfo)):
+        zones = np.full(timestamps.shape, 0)
+        names = [_as_zone(zone)]
+    else:
+        names, zones = np.unique(np.asarray(zone), return_inverse=True)
+        names = [_as_zone(name) for name in names]
+        zones = zones.reshape(timestamps.shape)
+
+    valid = ~np.isnat(timestamps)
+    seconds = timestamps.astype('datetime64[s]').astype(np.int64)
+    first_year = last_year = 1970
+    if valid.any():
+        years = timestamps[valid].astype('datetime64[Y]').astype(int) + 1970
+        # Rounded out to decades so nearby data shares cached tables.
+        first_year = int(years.min()) // 10 * 10
+        last_year = int(years.max()) // 10 * 10 + 9
+
+    offsets = np.zeros(timestamps.shape, dtype=np.int64)
+    for index, name in enumerate(names):
+        selected = valid & (zones == index)
+        if not selected.any():
+            continue
+        boundaries, zone_offsets = _offset_table(name, first_year, last_year)
+        positions = np.searchsorted(boundaries, seconds[selected], side='right')
+        offsets[selected] = zone_offsets[positions - 1]
+
+    return timestamps - offsets.astype('timedelta64[s]')
+
+
+def calculate_datetime_delta_tz(
+    date1: npt.ArrayLike,
+    zone1: str | tzinfo | npt.ArrayLike,
+    date2: npt.ArrayLike,
+    zone2: str | tzinfo | npt.ArrayLike | None = None,
+) -> np.ndarray:
+    """Calculate elapsed time between arrays of local times in any zones.
+
+    Both sides are converted to UTC with `localize_to_utc`, so deltas are
+    correct across DST changes and between zones, at close to the cost of
+    `calculate_datetime_delta_array` on naive values.
+
+    Parameters
+    ----------
+    date1
+        The first datetimes, as naive local times.
+    zone1
+        Zone, or array of zones, of `date1`.
+    date2
+        The second datetimes, as naive local times.
+    zone2
+        Zone, or array of zones, of `date2`. Defaults to `zone1`.
+
+    Returns
+    -------
+    np.ndarray
+        timedelta64 array of the elapsed time from `date2` to `date1`.
+    """
+    if zone2 is None:
+        zone2 = zone1
+    return calculate_datetime_delta_array(
+        localize_to_utc(date1, zone1), localize_to_utc(date2, zone2),
+    )
@@ -1,3 +1,13 @@
+import mmap
+import os
+import re
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+
 def break_string_pattern(value: str) -> list[str]:
     """Break underscore seperated string into parts.
 
@@ -28,3 +38,365 @@ def count_characters_in_strings(values: list[str]) -> dict[str, int]:
         the number of characters in each key.
     """
     return {value: len(value) for value in values}
+
+
+def _arrow_utf8_lengths(array: Any) -> np.ndarray:
+    """Character lengths of a pyarrow array of strings.
+
+    string and large_string arrays are measured by Arrow's `utf8_length`
+    kernel, without creating any Python strings, and dictionary encoded
+    strings are decoded first. Other types fall back to the `len` of each
+    value. Nulls are given a length of 0.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        lengths = pc.fill_null(pc.utf8_length(array), 0)
+        return lengths.to_numpy().astype(np.int64)
+    return np.fromiter(
+        (0 if value is None else len(value) for value in array.to_pylist()),
+        dtype=np.int64,
+        count=len(array),
+    )
+
+
+def count_characters_in_strings_array(
+    values: Any,
+    as_dict: bool = False,
+) -> np.ndarray | dict[str, int]:
+    """Count the length of each string in an array of strings.
+
+    Vectorised version of `count_characters_in_strings`.
+
+    Parameters
+    ----------
+    values
+        A pyarrow string or large_string array (or chunked array), a NumPy
+        array of strings, or a list of strings. For pyarrow string input
+        the lengths are computed by Arrow, without creating any Python
+        strings. NumPy bytes ('S') arrays are decoded as UTF-8 first.
+    as_dict
+        Return a dictionary keyed by string, as `count_characters_in_strings`
+        does, instead of an array.
+
+    Returns
+    -------
+    np.ndarray | dict[str, int]
+        int64 array of the number of characters in each string, aligned
+        with `values`, with nulls counted as 0. A dictionary of the non-null
+        strings if `as_dict` is set.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'S':
+        values = np.char.decode(values, 'utf-8')
+
+    if hasattr(values, 'chunks'):
+        chunks = [
+            count_characters_in_strings_array(chunk) for chunk in values.chunks
+        ]
+        lengths = np.concatenate(chunks) if chunks else np.zeros(0, np.int64)
+    elif hasattr(values, 'buffers'):
+        lengths = _arrow_utf8_lengths(values)
+    elif isinstance(values, np.ndarray) and values.dtype.kind != 'O':
+        lengths = np.char.str_len(values).astype(np.int64)
+    else:
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+
+    if not as_dict:
+        return lengths
+    strings = values.to_pylist() if hasattr(values, 'to_pylist') else list(values)
+    return {
+        str(string): int(length)
+        for string, length in zip(strings, lengths)
+        if string is not None
+    }
+
+
+class StringPatternFile:
+    """Break each line of a file of underscore separated strings into parts.
+
+    A streaming version of `break_string_pattern` for files too large to
+    read into memory. The file is memory-mapped and scanned a block of
+    lines at a time, finding every delimiter in the block at once with
+    NumPy, and parts are given as offsets into the file or as `memoryview`
+    slices of it, so nothing is decoded unless the consumer asks for it
+    with `decode`.
+
+    `iter_offset_arrays` is the fastest way through a file, giving the
+    offsets of a block of lines as arrays. `iter_offsets` and `iter_parts`
+    create a Python object per part, which costs about as much as reading
+    and splitting each line. Memoryviews from `iter_parts` must be released
+    before the file is closed, as an exported buffer stops the mapping
+    being closed.
+
+    Examples
+    --------
+    >>> with StringPatternFile('keys.txt') as keys:
+    ...     for parts in keys.iter_offsets():
+    ...         region = keys.decode(*parts[0])
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        delimiter: bytes = b'_',
+        line_separator: bytes = b'\n',
+        block_size: int = 1 << 16,
+    ):
+        """Memory-map the file at `path`.
+
+        Parameters
+        ----------
+        path
+            File with one string per line.
+        delimiter
+            Bytes separating the parts of each string.
+        line_separator
+            Bytes separating the strings.
+        block_size
+            Approximate number of bytes scanned at once. Blocks are
+            extended to the end of a line.
+        """
+        self.delimiter = delimiter
+        self.line_separator = line_separator
+        self.block_size = block_size
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # Empty files cannot be memory-mapped.
+                self._buffer: mmap.mmap | bytes = b''
+            else:
+                self._buffer = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ,
+                )
+
+    def __enter__(self) -> 'StringPatternFile':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the file."""
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def _iter_blocks(self) -> Iterator[tuple[int, int]]:
+        """Yield the start and stop offsets of blocks of whole lines.
+
+        Each block ends with a line separator, except possibly the last.
+        """
+        buffer = self._buffer
+        size = len(buffer)
+        separator = self.line_separator
+        position = 0
+        while position < size:
+            end = min(position + self.block_size, size)
+            if end < size:
+                cut = buffer.rfind(separator, position, end)
+                if cut == -1:
+                    cut = buffer.find(separator, end)
+                end = size if cut == -1 else cut + len(separator)
+            yield position, end
+            position = end
+
+    def _find_boundaries(
+        self,
+        start: int,
+        stop: int,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the start, end and kind of every separator in a block.
+
+        Offsets are relative to `start`. The kind is True for a line
+        separator and False for a delimiter. The block is read in place in
+        the mapped file, without copying it.
+        """
+        delimiter, separator = self.delimiter, self.line_separator
+        if len(delimiter) == len(separator) == 1:
+            data = np.frombuffer(
+                self._buffer, dtype=np.uint8, count=stop - start, offset=start,
+            )
+            is_line_end = data == separator[0]
+            starts = np.flatnonzero(is_line_end | (data == delimiter[0]))
+            return starts, starts + 1, is_line_end[starts]
+
+        # Line separators are listed first so they win where both match.
+        pattern = re.compile(
+            b'(' + re.escape(separator) + b')|' + re.escape(delimiter),
+        )
+        with memoryview(self._buffer) as view, view[start:stop] as block:
+            matches = [
+                (match.start(), match.end(), match.lastindex == 1)
+                for match in pattern.finditer(block)
+            ]
+        if not matches:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=bool)
+        starts, ends, is_line_end = map(np.array, zip(*matches))
+        return starts, ends, is_line_end
+
+    def iter_offset_arrays(self) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Yield the byte offsets of the parts of a block of lines at a time.
+
+        Yields
+        ------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            int64 arrays `starts` and `stops` of the offsets of every part in
+            the block, and `lines`, the index of the first part of each line
+            followed by the number of parts. Line `i` has the parts
+            `lines[i]:lines[i + 1]`.
+        """
+        separator = self.line_separator
+        for block_start, block_stop in self._iter_blocks():
+            # The final separator ends the last line rather than starting one.
+            tail = block_stop - len(separator)
+            if tail >= block_start and self._buffer[tail:block_stop] == separator:
+                block_stop = tail
+            size = block_stop - block_start
+            bounds_start, bounds_end, is_line_end = self._find_boundaries(
+                block_start, block_stop,
+            )
+            starts = np.concatenate(([0], bounds_end)).astype(np.int64)
+            stops = np.concatenate((bounds_start, [size])).astype(np.int64)
+            lines = np.concatenate((
+                [0], np.flatnonzero(is_line_end) + 1, [len(starts)],
+            )).astype(np.int64)
+            yield starts + block_start, stops + block_start, lines
+
+    def iter_offsets(self) -> Iterator[list[tuple[int, int]]]:
+        """Yield the (start, stop) byte offsets of the parts of each line."""
+        for starts, stops, lines in self.iter_offset_arrays():
+            offsets = list(zip(starts.tolist(), stops.tolist()))
+            bounds = lines.tolist()
+            for first, last in zip(bounds, bounds[1:]):
+                yield offsets[first:last]
+
+    def iter_parts(self) -> Iterator[list[memoryview]]:
+        """Yield the parts of each line as zero-copy memoryviews."""
+        view = memoryview(self._buffer)
+        try:
+            for parts in self.iter_offsets():
+                yield [view[start:stop] for start, stop in parts]
+        finally:
+            view.release()
+
+    def decode(self, start: int, stop: int, encoding: str = 'utf-8') -> str:
+        """Decode the part between byte offsets `start` and `stop`."""
+        return self._buffer[start:stop].decode(encoding)
+
+
+class TokenVocabulary:
+    """Interned set of tokens, each given a stable integer ID.
+
+    IDs are assigned in order of first appearance, starting from 0, and
+    can be shared between batches so that IDs from different batches can be
+    joined on directly.
+    """
+
+    def __init__(self, tokens: Iterable[str] = ()):
+        """Initialise the vocabulary, assigning IDs to any `tokens` given."""
+        self._ids: dict[str, int] = {}
+        self._tokens: list[str] = []
+        for token in tokens:
+            self.id(token)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._ids
+
+    def __getitem__(self, token_id: int) -> str:
+        """Return the token with the given ID."""
+        if len(self._tokens) != len(self._ids):
+            self._tokens = list(self._ids)
+        return self._tokens[token_id]
+
+    def id(self, token: str) -> int:
+        """Return the ID of `token`, assigning the next one if it is new."""
+        return self._ids.setdefault(token, len(self._ids))
+
+
+@dataclass
+class TokenisedStrings:
+    """Parts of many strings, stored as IDs into a shared vocabulary.
+
+    Row `i` has the token IDs `token_ids[offsets[i]:offsets[i + 1]]`.
+
+    Attributes
+    ----------
+    vocabulary
+        The vocabulary the token IDs refer to.
+    token_ids
+        int64 array of the ID of every token, row after row.
+    offsets
+        int64 array of the start of each row in `token_ids`, followed by
+        the total number of tokens.
+    """
+
+    vocabulary: TokenVocabulary
+    token_ids: np.ndarray = field(repr=False)
+    offsets: np.ndarray = field(repr=False)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def row_ids(self, row: int) -> np.ndarray:
+        """Return the token IDs of one row."""
+        return self.token_ids[self.offsets[row]:self.offsets[row + 1]]
+
+    def __getitem__(self, row: int) -> list[str]:
+        """Return the parts of one row, as `break_string_pattern` would."""
+        return [self.vocabulary[token_id] for token_id in self.row_ids(row)]
+
+
+def break_string_patterns(
+    values: Iterable[str],
+    vocabulary: TokenVocabulary | None = None,
+    delimiter: str = '_',
+) -> TokenisedStrings:
+    """Break many underscore separated strings into interned token IDs.
+
+    Batch version of `break_string_pattern`. Each distinct token is stored
+    once in the vocabulary, and every occurrence only as an integer, so
+    memory grows with the number of distinct tokens rather than the total.
+
+    Parameters
+    ----------
+    values
+        Strings containing `n` underscore characters.
+    vocabulary
+        Vocabulary to add tokens to, so IDs are consistent across batches.
+        A new one is created if not given.
+    delimiter
+        String separating the parts.
+
+    Returns
+    -------
+    TokenisedStrings
+        Token IDs and per-row offsets into them.
+
+    Examples
+    --------
+    >>> parts = break_string_patterns(['north_shoes_jan', 'south_shoes_jan'])
+    >>> parts.token_ids
+    array([0, 1, 2, 3, 1, 2])
+    >>> parts[1]
+    ['south', 'shoes', 'jan']
+    """
+    if vocabulary is None:
+        vocabulary = TokenVocabulary()
+    token_id = vocabulary.id
+
+    token_ids = array('q')
+    offsets = array('q', [0])
+    for value in values:
+        token_ids.extend(map(token_id, value.split(delimiter)))
+        offsets.append(len(token_ids))
+
+    return TokenisedStrings(
+        vocabulary,
+        np.frombuffer(token_ids, dtype=np.int64),
+        np.frombuffer(offsets, dtype=np.int64),
+    )
@@ -1,4 +1,28 @@
-from time import sleep
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from functools import cache, wraps
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+from operator import add, mul, sub
+from time import monotonic, perf_counter_ns, sleep, time
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Protocol, Sequence
+
+import numpy as np
+import numpy.typing as npt
 
 
 def slow_add(a: int, b: int) -> int:
@@ -59,3 +83,1453 @@ def complex_calculation_2(a: int, b: int, c: int) -> int:
     intermediate_step_2 = slow_add(intermediate_step_1, a)
 
     return intermediate_step_2 - c
+
+
+def slow_add_batch(a: npt.ArrayLike, b: npt.ArrayLike) -> np.ndarray:
+    """Add two arrays of numbers slowly, paying the cost once per batch.
+
+    Parameters
+    ----------
+    a
+        An integer or array of integers.
+    b
+        An integer or array of integers, broadcastable against `a`.
+
+    Returns
+    -------
+    np.ndarray
+        The element-wise sum of `a` and `b`.
+    """
+    sleep(10)
+    return np.add(a, b)
+
+
+def slow_multiply_batch(a: npt.ArrayLike, b: npt.ArrayLike) -> np.ndarray:
+    """Multiply two arrays of numbers slowly, paying the cost once per batch.
+
+    Parameters
+    ----------
+    a
+        An integer or array of integers.
+    b
+        An integer or array of integers, broadcastable against `a`.
+
+    Returns
+    -------
+    np.ndarray
+        The element-wise product of `a` and `b`.
+    """
+    sleep(10)
+    return np.multiply(a, b)
+
+
+def complex_calculation_1_batch(
+    a: npt.ArrayLike,
+    b: npt.ArrayLike,
+) -> np.ndarray:
+    """Batch version of `complex_calculation_1` over columns of inputs.
+
+    Parameters
+    ----------
+    a
+        An array of integers.
+    b
+        An array of integers, broadcastable against `a`.
+
+    Returns
+    -------
+    np.ndarray
+        result = (a + (a * ((a+1) + b)) ) - 1, element-wise.
+    """
+    a = np.asarray(a)
+
+    intermediate_step_1 = a + 1
+
+    intermediate_step_2 = slow_add_batch(intermediate_step_1, b)
+
+    intermediate_step_3 = slow_multiply_batch(intermediate_step_2, a)
+
+    intermediate_step_4 = slow_add_batch(intermediate_step_3, a)
+
+    return intermediate_step_4 - 1
+
+
+def complex_calculation_2_batch(
+    a: npt.ArrayLike,
+    b: npt.ArrayLike,
+    c: npt.ArrayLike,
+) -> np.ndarray:
+    """Batch version of `complex_calculation_2` over columns of inputs.
+
+    Parameters
+    ----------
+    a
+        An array of integers.
+    b
+        An array of integers, broadcastable against `a`.
+    c
+        An array of integers, broadcastable against `a`.
+
+    Returns
+    -------
+    np.ndarray
+        result = ((a * b) + a) - c, element-wise.
+    """
+    intermediate_step_1 = slow_multiply_batch(a, b)
+
+    intermediate_step_2 = slow_add_batch(intermediate_step_1, a)
+
+    return intermediate_step_2 - np.asarray(c)
+
+
+async def slow_add_async(a: int, b: int) -> int:
+    """Add two numbers slowly, without blocking the event loop."""
+    await asyncio.sleep(10)
+    return a + b
+
+
+async def slow_multiply_async(a: int, b: int) -> int:
+    """Multiply two numbers slowly, without blocking the event loop."""
+    await asyncio.sleep(10)
+    return a * b
+
+
+async def complex_calculation_1_async(a: int, b: int) -> int:
+    """Asynchronous version of `complex_calculation_1`.
+
+    Parameters
+    ----------
+    a
+        An integer.
+    b
+        An integer.
+
+    Returns
+    -------
+    int
+        result = (a + (a * ((a+1) + b)) ) - 1.
+    """
+    intermediate_step_1 = a + 1
+
+    intermediate_step_2 = await slow_add_async(intermediate_step_1, b)
+
+    intermediate_step_3 = await slow_multiply_async(intermediate_step_2, a)
+
+    intermediate_step_4 = await slow_add_async(intermediate_step_3, a)
+
+    return intermediate_step_4 - 1
+
+
+async def complex_calculation_2_async(a: int, b: int, c: int) -> int:
+    """Asynchronous version of `complex_calculation_2`.
+
+    Parameters
+    ----------
+    a
+        An integer.
+    b
+        An integer.
+    c
+        An integer.
+
+    Returns
+    -------
+    int
+        result = ((a * b) + a) - c
+    """
+    intermediate_step_1 = await slow_multiply_async(a, b)
+
+    intermediate_step_2 = await slow_add_async(intermediate_step_1, a)
+
+    return intermediate_step_2 - c
+
+
+async def run_with_concurrency_limit(
+    func: Callable[..., Awaitable[int]],
+    arguments: Iterable[Sequence[int]],
+    limit: int = 1000,
+) -> list[int]:
+    """Await `func` for many sets of inputs, at most `limit` at a time.
+
+    A fixed number of worker tasks pull inputs from `arguments` as they
+    become free, so coroutines are only created for calls that can start.
+
+    Parameters
+    ----------
+    func
+        Coroutine function to call, e.g. `complex_calculation_1_async`.
+    arguments
+        One sequence of positional arguments per call.
+    limit
+        Maximum number of calls in flight at once.
+
+    Returns
+    -------
+    list[int]
+        The result of each call, in the order of `arguments`.
+
+    Raises
+    ------
+    ValueError
+        If `limit` is less than 1.
+    Exception
+        The first exception raised by `func`, after the remaining calls have
+        been cancelled.
+    """
+    if limit < 1:
+        raise ValueError(f'limit must be at least 1, got {limit=}.')
+
+    queue = enumerate(arguments)
+    results: dict[int, int] = {}
+
+    async def worker() -> None:
+        for index, args in queue:
+            results[index] = await func(*args)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+    return [results[index] for index in range(len(results))]
+
+
+@dataclass(frozen=True)
+class CalculationStep:
+    """A single intermediate step of a calculation.
+
+    Attributes
+    ----------
+    name
+        Name of the step, which later steps use to refer to its result.
+    func
+        Name of the module level function applied by the step. Looked up at
+        call time so that patched functions are picked up.
+    args
+        Arguments passed to `func`. Strings refer to calculation inputs or
+        earlier steps, integers are used as constants.
+    """
+
+    name: str
+    func: str
+    args: tuple[str | int, ...]
+
+    @property
+    def dependencies(self) -> tuple[str, ...]:
+        """Names of the inputs and steps this step needs."""
+        return tuple(arg for arg in self.args if isinstance(arg, str))
+
+    def apply(self, values: dict[str, int]) -> int:
+        """Apply the step using already known `values`."""
+        func = globals()[self.func]
+        return func(*(
+            values[arg] if isinstance(arg, str) else arg for arg in self.args
+        ))
+
+
+@dataclass(frozen=True)
+class Calculation:
+    """A calculation described as a dependency graph of steps.
+
+    Attributes
+    ----------
+    inputs
+        Names of the calculation inputs, in positional order.
+    steps
+        The steps of the calculation in a valid evaluation order. The result
+        of the final step is the result of the calculation.
+    """
+
+    inputs: tuple[str, ...]
+    steps: tuple[CalculationStep, ...]
+
+    def evaluate(self, *args: int) -> int:
+        """Evaluate each step in turn for one set of inputs."""
+        values = dict(zip(self.inputs, args, strict=True))
+        for step in self.steps:
+            values[step.name] = step.apply(values)
+        return values[self.steps[-1].name]
+
+
+CALCULATION_1 = Calculation(
+    inputs=('a', 'b'),
+    steps=(
+        CalculationStep('intermediate_step_1', 'add', ('a', 1)),
+        CalculationStep(
+            'intermediate_step_2', 'slow_add', ('intermediate_step_1', 'b'),
+        ),
+        CalculationStep(
+            'intermediate_step_3', 'slow_multiply', ('intermediate_step_2', 'a'),
+        ),
+        CalculationStep(
+            'intermediate_step_4', 'slow_add', ('intermediate_step_3', 'a'),
+        ),
+        CalculationStep('result', 'sub', ('intermediate_step_4', 1)),
+    ),
+)
+"""The steps of `complex_calculation_1`."""
+
+CALCULATION_2 = Calculation(
+    inputs=('a', 'b', 'c'),
+    steps=(
+        CalculationStep('intermediate_step_1', 'slow_multiply', ('a', 'b')),
+        CalculationStep(
+            'intermediate_step_2', 'slow_add', ('intermediate_step_1', 'a'),
+        ),
+        CalculationStep('result', 'sub', ('intermediate_step_2', 'c')),
+    ),
+)
+"""The steps of `complex_calculation_2`."""
+
+
+def run_calculations_concurrently(
+    calculation: Calculation,
+    arguments: Iterable[Sequence[int]],
+    max_workers: int | None = None,
+) -> list[int]:
+    """Run a calculation for many sets of inputs on a thread pool.
+
+    Every step of every invocation is a node in one dependency graph, and any
+    step whose dependencies are known is submitted straight away. Steps from
+    different invocations therefore overlap, so the wall time tends towards
+    the length of the longest chain of steps rather than the sum of them.
+
+    Parameters
+    ----------
+    calculation
+        The calculation to run, e.g. `CALCULATION_1`.
+    arguments
+        One sequence of input values per invocation.
+    max_workers
+        Maximum number of threads, passed to `ThreadPoolExecutor`.
+
+    Returns
+    -------
+    list[int]
+        The result of each invocation, in the order of `arguments`.
+
+    Raises
+    ------
+    Exception
+        The first exception raised by any step. Steps not yet started are
+        cancelled.
+    """
+    values = [
+        dict(zip(calculation.inputs, args, strict=True)) for args in arguments
+    ]
+    steps = {step.name: step for step in calculation.steps}
+    dependents: dict[str, list[str]] = {name: [] for name in steps}
+    for step in calculation.steps:
+        for dependency in step.dependencies:
+            if dependency in dependents:
+                dependents[dependency].append(step.name)
+
+    # Number of unfinished steps each step of each invocation is waiting on.
+    waiting_on = [
+        {
+            step.name: sum(dep in steps for dep in step.dependencies)
+            for step in calculation.steps
+        }
+        for _ in values
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running: dict[Future, tuple[int, str]] = {}
+
+        def submit(index: int, name: str) -> None:
+            future = executor.submit(steps[name].apply, values[index])
+            running[future] = (index, name)
+
+        for index, waiting in enumerate(waiting_on):
+            for name, count in waiting.items():
+                if count == 0:
+                    submit(index, name)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, name = running.pop(future)
+                try:
+                    values[index][name] = future.result()
+                except BaseException:
+                    for pending in running:
+                        pending.cancel()
+                    raise
+                for dependent in dependents[name]:
+                    waiting_on[index][dependent] -= 1
+                    if waiting_on[index][dependent] == 0:
+                        submit(index, dependent)
+
+    final_step = calculation.steps[-1].name
+    return [invocation[final_step] for invocation in values]
+
+
+SLOW_FUNCTIONS = ('slow_add', 'slow_multiply')
+"""Names of the module level functions that are expensive to call."""
+
+
+SlowFunctionWrapper = Callable[
+    [str, Callable[[int, int], int]], Callable[[int, int], int],
+]
+
+_active_wrappers: list[SlowFunctionWrapper] = []
+_wrappers_lock = threading.Lock()
+_originals: dict[str, Callable[[int, int], int]] = {}
+_dispatch_table: dict[str, Callable[[int, int], int]] = {}
+
+
+def _dispatcher(name: str) -> Callable[[int, int], int]:
+    """Return a function calling the currently wrapped version of `name`."""
+    original = _originals[name]
+
+    @wraps(original)
+    def dispatch(a: int, b: int) -> int:
+        # Falls back to the original if the last block exits mid call.
+        return _dispatch_table.get(name, original)(a, b)
+
+    return dispatch
+
+
+def _rebuild_dispatch_table() -> None:
+    """Wrap each original in every active wrapper, latest outermost."""
+    for name, func in _originals.items():
+        for wrapper in _active_wrappers:
+            func = wrapper(name, func)
+        _dispatch_table[name] = func
+
+
+@contextmanager
+def _wrapped_slow_functions(wrapper: SlowFunctionWrapper) -> Iterator[None]:
+    """Route each slow function through `wrapper(name, function)` in the block.
+
+    The calculations look the slow functions up by name, so while any
+    wrapper is active the module functions are replaced by one dispatcher
+    each, which calls through every active wrapper. Blocks may exit in any
+    order, including from other threads; the originals are restored when
+    the last one exits.
+    """
+    module = globals()
+    with _wrappers_lock:
+        if not _active_wrappers:
+            _originals.update((name, module[name]) for name in SLOW_FUNCTIONS)
+            module.update((name, _dispatcher(name)) for name in SLOW_FUNCTIONS)
+        _active_wrappers.append(wrapper)
+        _rebuild_dispatch_table()
+    try:
+        yield
+    finally:
+        with _wrappers_lock:
+            _active_wrappers.remove(wrapper)
+            _rebuild_dispatch_table()
+            if not _active_wrappers:
+                module.update(_originals)
+                _originals.clear()
+                _dispatch_table.clear()
+
+
+class OperandCache:
+    """Memoisation cache for the slow functions, keyed on their operands.
+
+    Results are held in an in-process LRU tier and, if `path` is given, an
+    SQLite tier that survives restarts. Lookups check memory first, then
+    disk, and only call the slow function if both miss.
+
+    Attributes
+    ----------
+    hits
+        Number of lookups answered from either tier.
+    misses
+        Number of lookups that had to call the slow function.
+
+    Examples
+    --------
+    >>> cache = OperandCache(max_size=10_000, path='operands.sqlite')
+    >>> with cache.enabled():
+    ...     complex_calculation_1(2, 3)
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float | None = None,
+        path: str | None = None,
+        max_disk_size: int | None = None,
+    ):
+        """Initialise the cache.
+
+        Parameters
+        ----------
+        max_size
+            Maximum number of entries held in memory, least recently used
+            entries are evicted first.
+        ttl
+            Seconds an entry stays valid in either tier, or None to keep
+            entries until they are evicted.
+        path
+            Path of the SQLite database for the on-disk tier, or None for a
+            memory only cache.
+        max_disk_size
+            Maximum number of entries held on disk, oldest entries are
+            evicted first. None for no limit.
+        """
+        if max_size < 1:
+            raise ValueError(f'max_size must be at least 1, got {max_size=}.')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_disk_size = max_disk_size
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[tuple[str, int, int], tuple[int, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            # Values are stored as text as Python ints are unbounded.
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS operand_cache ('
+                ' func TEXT, a TEXT, b TEXT, value TEXT, created REAL,'
+                ' PRIMARY KEY (func, a, b))'
+            )
+            self._connection.commit()
+
+    def _is_fresh(self, created: float) -> bool:
+        return self.ttl is None or time() - created < self.ttl
+
+    def _lookup(self, key: tuple[str, int, int]) -> int | None:
+        entry = self._memory.get(key)
+        if entry is not None:
+            if self._is_fresh(entry[1]):
+                self._memory.move_to_end(key)
+                return entry[0]
+            del self._memory[key]
+
+        if self._connection is None:
+            return None
+        row = self._connection.execute(
+            'SELECT value, created FROM operand_cache'
+            ' WHERE func = ? AND a = ? AND b = ?',
+            (key[0], str(key[1]), str(key[2])),
+        ).fetchone()
+        if row is None or not self._is_fresh(row[1]):
+            return None
+        value = int(row[0])
+        self._remember(key, value, row[1])
+        return value
+
+    def _remember(self, key: tuple[str, int, int], value: int, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _store(self, key: tuple[str, int, int], value: int) -> None:
+        created = time()
+        self._remember(key, value, created)
+        if self._connection is None:
+            return
+        self._connection.execute(
+            'INSERT OR REPLACE INTO operand_cache VALUES (?, ?, ?, ?, ?)',
+            (key[0], str(key[1]), str(key[2]), str(value), created),
+        )
+        if self.ttl is not None:
+            self._connection.execute(
+                'DELETE FROM operand_cache WHERE created <= ?',
+                (created - self.ttl,),
+            )
+        if self.max_disk_size is not None:
+            self._connection.execute(
+                'DELETE FROM operand_cache WHERE rowid NOT IN ('
+                ' SELECT rowid FROM operand_cache'
+                ' ORDER BY created DESC LIMIT ?)',
+                (self.max_disk_size,),
+            )
+        self._connection.commit()
+
+    def get_or_compute(
+        self,
+        name: str,
+        func: Callable[[int, int], int],
+        a: int,
+        b: int,
+    ) -> int:
+        """Return the cached result of `func(a, b)`, computing it on a miss.
+
+        Parameters
+        ----------
+        name
+            Name identifying `func` in the cache, e.g. 'slow_add'.
+        func
+            Function to call on a miss.
+        a
+            First operand.
+        b
+            Second operand.
+
+        Returns
+        -------
+        int
+            The result of `func(a, b)`.
+        """
+        key = (name, a, b)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Computed outside the lock so other lookups are not held up.
+        value = func(a, b)
+        with self._lock:
+            self._store(key, value)
+        return value
+
+    def wrap(
+        self,
+        name: str,
+        func: Callable[[int, int], int],
+    ) -> Callable[[int, int], int]:
+        """Return a version of `func` which goes through the cache."""
+        @wraps(func)
+        def cached(a: int, b: int) -> int:
+            return self.get_or_compute(name, func, a, b)
+
+        return cached
+
+    @contextmanager
+    def enabled(self) -> Iterator['OperandCache']:
+        """Route the module's slow functions through this cache in the block.
+
+        Affects every caller of `slow_add` and `slow_multiply`, including
+        `complex_calculation_1` and `complex_calculation_2`.
+        """
+        with _wrapped_slow_functions(self.wrap):
+            yield self
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers and reset the counters."""
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._connection is not None:
+                self._connection.execute('DELETE FROM operand_cache')
+                self._connection.commit()
+
+    def close(self) -> None:
+        """Close the on-disk tier, if there is one."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_FUSIBLE_OPERATIONS = {
+    'add': add,
+    'sub': sub,
+    'slow_add': add,
+    'slow_multiply': mul,
+}
+"""Operator applied in place of each step function when fusing."""
+
+
+class _Polynomial:
+    """Integer polynomial in named variables, used to trace a calculation.
+
+    Each monomial is a sorted tuple of variable names, with a variable
+    repeated once per power, mapped to its coefficient.
+    """
+
+    def __init__(self, terms: dict[tuple[str, ...], int]):
+        self.terms = {
+            monomial: coefficient
+            for monomial, coefficient in terms.items()
+            if coefficient != 0
+        }
+
+    @classmethod
+    def lift(cls, value: '_Polynomial | int') -> '_Polynomial':
+        if isinstance(value, _Polynomial):
+            return value
+        return cls({(): value})
+
+    def __add__(self, other: '_Polynomial | int') -> '_Polynomial':
+        terms = dict(self.terms)
+        for monomial, coefficient in self.lift(other).terms.items():
+            terms[monomial] = terms.get(monomial, 0) + coefficient
+        return _Polynomial(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self) -> '_Polynomial':
+        return _Polynomial({m: -c for m, c in self.terms.items()})
+
+    def __sub__(self, other: '_Polynomial | int') -> '_Polynomial':
+        return self + -self.lift(other)
+
+    def __rsub__(self, other: '_Polynomial | int') -> '_Polynomial':
+        return self.lift(other) - self
+
+    def __mul__(self, other: '_Polynomial | int') -> '_Polynomial':
+        terms: dict[tuple[str, ...], int] = {}
+        for left, left_coefficient in self.terms.items():
+            for right, right_coefficient in self.lift(other).terms.items():
+                monomial = tuple(sorted(left + right))
+                terms[monomial] = (
+                    terms.get(monomial, 0) + left_coefficient * right_coefficient
+                )
+        return _Polynomial(terms)
+
+    __rmul__ = __mul__
+
+    def __str__(self) -> str:
+        if not self.terms:
+            return '0'
+        expression = ''
+        for monomial, coefficient in sorted(
+            self.terms.items(), key=lambda item: (-len(item[0]), item[0]),
+        ):
+            factors = [str(abs(coefficient))] if abs(coefficient) != 1 else []
+            term = '*'.join(factors + list(monomial)) or '1'
+            if not expression:
+                expression = f'-{term}' if coefficient < 0 else term
+            else:
+                expression += f' - {term}' if coefficient < 0 else f' + {term}'
+        return expression
+
+
+class FusedCalculation:
+    """A calculation folded into a single expression of its inputs.
+
+    Calling it evaluates the expression in one pass, without any of the
+    intermediate slow function calls. The same expression works on ints and
+    on NumPy arrays, which are evaluated element-wise.
+
+    Attributes
+    ----------
+    inputs
+        Names of the inputs, in positional order.
+    expression
+        The folded expression, e.g. 'a*a + a*b + 2*a - 1'.
+    """
+
+    def __init__(self, inputs: tuple[str, ...], polynomial: _Polynomial):
+        """Evaluate `polynomial` as a function of `inputs`."""
+        self.inputs = inputs
+        self.expression = str(polynomial)
+        # Each term as its coefficient and the positions of its factors.
+        self._terms = [
+            (coefficient, tuple(inputs.index(name) for name in monomial))
+            for monomial, coefficient in polynomial.terms.items()
+        ]
+
+    def __call__(self, *args: int | npt.ArrayLike) -> int | np.ndarray:
+        """Evaluate the expression for the given inputs.
+
+        Raises
+        ------
+        ValueError
+            If not given exactly one argument per input, as
+            `Calculation.evaluate` does.
+        """
+        if len(args) != len(self.inputs):
+            raise ValueError(
+                f'Expected {len(self.inputs)} arguments {self.inputs}, '
+                f'got {len(args)}.'
+            )
+        if any(isinstance(arg, (list, tuple, np.ndarray)) for arg in args):
+            args = tuple(np.asarray(arg) for arg in args)
+        total = 0
+        for coefficient, factors in self._terms:
+            total = total + coefficient * math.prod(args[i] for i in factors)
+        return total
+
+    def __repr__(self) -> str:
+        return f'FusedCalculation({self.inputs!r}, {self.expression!r})'
+
+
+@cache
+def fuse_calculation(calculation: Calculation) -> FusedCalculation:
+    """Fold the steps of a calculation into a single expression.
+
+    Each step is traced symbolically, with the slow functions replaced by
+    the operator they compute, and the result is expanded and simplified.
+    Only use this when the intermediate values are not needed, as none of
+    the step functions are called.
+
+    Parameters
+    ----------
+    calculation
+        The calculation to fuse, e.g. `CALCULATION_1`.
+
+    Returns
+    -------
+    FusedCalculation
+        Callable evaluating the whole calculation in one pass.
+
+    Raises
+    ------
+    ValueError
+        If a step uses a function with no known operator.
+
+    Examples
+    --------
+    >>> fuse_calculation(CALCULATION_1).expression
+    'a*a + a*b + 2*a - 1'
+    """
+    values: dict[str, _Polynomial | int] = {
+        name: _Polynomial({(name,): 1}) for name in calculation.inputs
+    }
+    for step in calculation.steps:
+        try:
+            operation = _FUSIBLE_OPERATIONS[step.func]
+        except KeyError:
+            raise ValueError(
+                f'Cannot fuse step {step.name!r} using {step.func!r}.'
+            ) from None
+        values[step.name] = operation(*(
+            values[arg] if isinstance(arg, str) else arg for arg in step.args
+        ))
+
+    result = _Polynomial.lift(values[calculation.steps[-1].name])
+    return FusedCalculation(calculation.inputs, result)
+
+
+class IncrementalCalculation:
+    """Stateful evaluator which only recomputes steps affected by a change.
+
+    The last inputs and every intermediate value are kept. When called
+    again, only the steps which depend, directly or through other steps, on
+    an input that changed are recomputed. For example, sweeping `c` in
+    `CALCULATION_2` only reruns the final subtraction.
+
+    Attributes
+    ----------
+    calculation
+        The calculation being evaluated.
+    values
+        The current inputs and intermediate values, by name.
+    recomputed
+        Names of the steps recomputed by the last evaluation.
+
+    Examples
+    --------
+    >>> evaluator = IncrementalCalculation(CALCULATION_2)
+    >>> evaluator(10, 20, 1)
+    209
+    >>> evaluator.update(c=2)
+    208
+    >>> evaluator.recomputed
+    ('result',)
+    """
+
+    def __init__(self, calculation: Calculation):
+        """Initialise the evaluator with no known values."""
+        self.calculation = calculation
+        self.values: dict[str, int] = {}
+        self.recomputed: tuple[str, ...] = ()
+
+        # Inputs and steps each step depends on, directly or indirectly.
+        sources: dict[str, set[str]] = {}
+        for step in calculation.steps:
+            sources[step.name] = set(step.dependencies).union(
+                *(sources.get(name, set()) for name in step.dependencies)
+            )
+        self._affected = {
+            name: {step for step, needs in sources.items() if name in needs}
+            for name in calculation.inputs
+        }
+
+    def __call__(self, *args: int) -> int:
+        """Evaluate the calculation for a full set of inputs."""
+        return self.update(**dict(zip(self.calculation.inputs, args, strict=True)))
+
+    def update(self, **changes: int) -> int:
+        """Change some inputs and return the updated result.
+
+        Parameters
+        ----------
+        **changes
+            New values for some of the calculation inputs.
+
+        Returns
+        -------
+        int
+            The result of the calculation for the current inputs.
+
+        Raises
+        ------
+        ValueError
+            If an input is unknown, or an input has never been given.
+        """
+        unknown = set(changes) - set(self.calculation.inputs)
+        if unknown:
+            raise ValueError(f'Unknown inputs {sorted(unknown)}.')
+        missing = set(self.calculation.inputs) - set(self.values) - set(changes)
+        if missing:
+            raise ValueError(f'No value given for inputs {sorted(missing)}.')
+
+        for name, value in changes.items():
+            if name not in self.values or self.values[name] != value:
+                self.values[name] = value
+                # Dropped up front so a failed step is retried next time.
+                for step_name in self._affected[name]:
+                    self.values.pop(step_name, None)
+
+        recomputed = []
+        for step in self.calculation.steps:
+            if step.name not in self.values:
+                self.values[step.name] = step.apply(self.values)
+                recomputed.append(step.name)
+        self.recomputed = tuple(recomputed)
+
+        return self.values[self.calculation.steps[-1].name]
+
+
+@dataclass(frozen=True)
+class StepRecord:
+    """Record of a single call to one of the slow functions.
+
+    Attributes
+    ----------
+    func
+        Name of the function called.
+    args
+        Arguments the function was called with.
+    result
+        Value returned, or None if the call raised.
+    start_ns
+        Start of the call, from `time.perf_counter_ns`.
+    duration_ns
+        Length of the call in nanoseconds.
+    thread_id
+        Identifier of the thread which made the call.
+    error
+        Representation of the exception raised, if any.
+    """
+
+    func: str
+    args: tuple[int, ...]
+    result: int | None
+    start_ns: int
+    duration_ns: int
+    thread_id: int
+    error: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the record as a JSON serialisable dictionary."""
+        return {
+            'func': self.func,
+            'args': list(self.args),
+            'result': self.result,
+            'start_ns': self.start_ns,
+            'duration_ns': self.duration_ns,
+            'thread_id': self.thread_id,
+            'error': self.error,
+        }
+
+
+class TraceSink(Protocol):
+    """Destination for step records produced by `tracing`."""
+
+    def record(self, step: StepRecord) -> None:
+        """Handle one step record, may be called from any thread."""
+
+    def close(self) -> None:
+        """Flush and release any resources once tracing stops."""
+
+
+class RingBufferSink:
+    """Keep the most recent step records in memory.
+
+    Attributes
+    ----------
+    records
+        The retained records, oldest first.
+    """
+
+    def __init__(self, capacity: int = 10_000):
+        """Initialise the buffer to hold at most `capacity` records."""
+        self.records: deque[StepRecord] = deque(maxlen=capacity)
+
+    def record(self, step: StepRecord) -> None:
+        """Append the record, dropping the oldest if full."""
+        self.records.append(step)
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+class JsonlSink:
+    """Write each step record as a line of JSON."""
+
+    def __init__(self, path: str | os.PathLike):
+        """Open `path` for appending."""
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, step: StepRecord) -> None:
+        """Write the record as one line."""
+        line = json.dumps(step.to_dict())
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+class ChromeTraceSink:
+    """Write step records in the Chrome trace event format.
+
+    The file can be opened in chrome://tracing, Perfetto or speedscope to
+    view the calls as a flame graph, with one row per thread.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        """Collect events to write to `path` on close."""
+        self.path = path
+        self._events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, step: StepRecord) -> None:
+        """Add the record as a complete ('X') event."""
+        event = {
+            'name': step.func,
+            'ph': 'X',
+            'ts': step.start_ns / 1000,
+            'dur': step.duration_ns / 1000,
+            'pid': os.getpid(),
+            'tid': step.thread_id,
+            'args': {
+                'args': list(step.args),
+                'result': step.result,
+                'error': step.error,
+            },
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def close(self) -> None:
+        """Write the collected events."""
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': self._events}, file)
+
+
+def _traced(
+    sinks: Sequence[TraceSink],
+) -> Callable[[str, Callable[[int, int], int]], Callable[[int, int], int]]:
+    """Return a wrapper which reports each call to every sink."""
+    def wrapper(name: str, func: Callable[[int, int], int]):
+        @wraps(func)
+        def traced(*args: int) -> int:
+            result = error = None
+            start = perf_counter_ns()
+            try:
+                result = func(*args)
+                return result
+            except BaseException as exc:
+                error = repr(exc)
+                raise
+            finally:
+                step = StepRecord(
+                    func=name,
+                    args=args,
+                    result=result,
+                    start_ns=start,
+                    duration_ns=perf_counter_ns() - start,
+                    thread_id=threading.get_ident(),
+                    error=error,
+                )
+                for sink in sinks:
+                    sink.record(step)
+
+        return traced
+
+    return wrapper
+
+
+@contextmanager
+def tracing(*sinks: TraceSink) -> Iterator[None]:
+    """Record every slow function call made in the block.
+
+    Nothing is wrapped outside the block, so tracing costs nothing when not
+    in use. Sinks are closed when the block exits.
+
+    Parameters
+    ----------
+    *sinks
+        Where to send the records, e.g. `RingBufferSink()`,
+        `JsonlSink('steps.jsonl')` or `ChromeTraceSink('trace.json')`.
+
+    Examples
+    --------
+    >>> buffer = RingBufferSink()
+    >>> with tracing(buffer, ChromeTraceSink('trace.json')):
+    ...     complex_calculation_1(2, 3)
+    >>> [step.func for step in buffer.records]
+    ['slow_add', 'slow_multiply', 'slow_add']
+    """
+    try:
+        with _wrapped_slow_functions(_traced(sinks)):
+            yield
+    finally:
+        for sink in sinks:
+            sink.close()
+
+
+class _InFlightCall:
+    """A call being made on behalf of every caller waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+def _copy_error(error: BaseException) -> BaseException:
+    """Return a copy of `error` of the same type, with the same attributes.
+
+    The copy is built without calling `__init__`, which may take different
+    arguments to the `args` the exception holds.
+    """
+    copied = type(error).__new__(type(error), *error.args)
+    copied.__dict__.update(error.__dict__)
+    return copied
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one execution.
+
+    While a call with a given key is running, any other thread making the
+    same call waits for it and receives the same result, or has a copy of
+    the same exception raised, chained to the original. Results are not
+    kept once the call finishes, see `OperandCache` for that.
+
+    Examples
+    --------
+    >>> group = SingleFlight()
+    >>> with group.enabled():
+    ...     # Threads calling slow_add(1, 2) at the same time share one call.
+    ...     ...
+    >>> calculation_1 = group.wrap('complex_calculation_1', complex_calculation_1)
+    """
+
+    def __init__(self):
+        """Initialise with no calls in flight."""
+        self._calls: dict[tuple, _InFlightCall] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: tuple, func: Callable[..., Any], *args: Any) -> Any:
+        """Return `func(*args)`, sharing the call with others using `key`.
+
+        Parameters
+        ----------
+        key
+            Hashable key identifying identical calls.
+        func
+            Function to call if no identical call is in flight.
+        *args
+            Arguments for `func`.
+
+        Returns
+        -------
+        Any
+            The result of the shared call.
+
+        Raises
+        ------
+        Exception
+            Whatever the shared call raised. Callers other than the one
+            which ran it get a copy of the same type, chained to the
+            original.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _InFlightCall()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func(*args)
+            except BaseException as exc:
+                call.error = exc
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is None:
+            return call.result
+        if leader:
+            raise call.error
+        # Raising the one exception in several threads at once would have
+        # them all rewrite its traceback, so each waiter gets its own copy.
+        raise _copy_error(call.error) from call.error
+
+    def wrap(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Return a version of `func` whose concurrent identical calls coalesce.
+
+        Works for any function taking hashable positional arguments, such as
+        `complex_calculation_1`.
+        """
+        @wraps(func)
+        def coalesced(*args: Any) -> Any:
+            return self.do((name, *args), func, *args)
+
+        return coalesced
+
+    @contextmanager
+    def enabled(self) -> Iterator['SingleFlight']:
+        """Coalesce calls to the module's slow functions in the block."""
+        with _wrapped_slow_functions(self.wrap):
+            yield self
+
+
+@dataclass
+class PartialResult:
+    """Progress of a calculation which may have stopped before finishing.
+
+    Attributes
+    ----------
+    calculation
+        The calculation being run.
+    values
+        The inputs and the value of every finished step, by name.
+    error
+        The exception raised by the first remaining step, if the run
+        stopped because it failed.
+    """
+
+    calculation: Calculation
+    values: dict[str, int] = field(default_factory=dict)
+    error: Exception | None = None
+
+    @property
+    def completed_steps(self) -> tuple[str, ...]:
+        """Names of the finished steps, in evaluation order."""
+        return tuple(
+            step.name for step in self.calculation.steps
+            if step.name in self.values
+        )
+
+    @property
+    def remaining_steps(self) -> tuple[str, ...]:
+        """Names of the steps still to run, in evaluation order."""
+        return tuple(
+            step.name for step in self.calculation.steps
+            if step.name not in self.values
+        )
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether every step has finished."""
+        return not self.remaining_steps
+
+    @property
+    def result(self) -> int | None:
+        """The result of the calculation, or None if not complete."""
+        return self.values.get(self.calculation.steps[-1].name)
+
+
+def resume_calculation(
+    partial: PartialResult,
+    timeout: float | None = None,
+    cancel: threading.Event | None = None,
+) -> PartialResult:
+    """Continue a calculation, stopping if out of time or cancelled.
+
+    The budget is checked before each step, so a step which has started is
+    always allowed to finish. Steps already in `partial` are not rerun. If
+    a step raises, the run stops there and the exception is kept in the
+    result alongside the values of the steps which finished, so resuming
+    retries only the failed step and those after it.
+
+    Parameters
+    ----------
+    partial
+        The progress so far, e.g. from `run_with_deadline`.
+    timeout
+        Seconds allowed for this run, or None for no limit.
+    cancel
+        Event which another thread can set to stop the run.
+
+    Returns
+    -------
+    PartialResult
+        A new record of progress, complete if every step finished, with
+        `error` set if a step raised.
+    """
+    deadline = None if timeout is None else monotonic() + timeout
+    values = dict(partial.values)
+    for step in partial.calculation.steps:
+        if step.name in values:
+            continue
+        if cancel is not None and cancel.is_set():
+            break
+        if deadline is not None and monotonic() >= deadline:
+            break
+        try:
+            values[step.name] = step.apply(values)
+        except Exception as exc:
+            return PartialResult(partial.calculation, values, error=exc)
+    return PartialResult(partial.calculation, values)
+
+
+def run_with_deadline(
+    calculation: Calculation,
+    *args: int,
+    timeout: float | None = None,
+    cancel: threading.Event | None = None,
+) -> PartialResult:
+    """Run a calculation, stopping between steps if out of time or cancelled.
+
+    Parameters
+    ----------
+    calculation
+        The calculation to run, e.g. `CALCULATION_1`.
+    *args
+        The calculation inputs.
+    timeout
+        Seconds allowed for the run, or None for no limit.
+    cancel
+        Event which another thread can set to stop the run.
+
+    Returns
+    -------
+    PartialResult
+        The finished steps and their values, and the exception if a step
+        raised. Pass it to `resume_calculation` to carry on later.
+
+    Examples
+    --------
+    >>> partial = run_with_deadline(CALCULATION_1, 2, 3, timeout=15)
+    >>> partial.completed_steps
+    ('intermediate_step_1', 'intermediate_step_2', 'intermediate_step_3')
+    >>> resume_calculation(partial).result
+    13
+    """
+    values = dict(zip(calculation.inputs, args, strict=True))
+    return resume_calculation(
+        PartialResult(calculation, values), timeout=timeout, cancel=cancel,
+    )
+
+
+def _evaluate_chunk(
+    calculation: Calculation,
+    inputs_name: str,
+    outputs_name: str,
+    shape: tuple[int, int],
+    start: int,
+    stop: int,
+) -> None:
+    """Evaluate rows `start` to `stop` of the shared inputs in a worker."""
+    inputs_memory = SharedMemory(name=inputs_name)
+    outputs_memory = SharedMemory(name=outputs_name)
+    try:
+        inputs = np.ndarray(shape, dtype=np.int64, buffer=inputs_memory.buf)
+        outputs = np.ndarray(shape[0], dtype=np.int64, buffer=outputs_memory.buf)
+        for row in range(start, stop):
+            outputs[row] = calculation.evaluate(*map(int, inputs[row]))
+        # The arrays must be released before the memory can be closed.
+        del inputs, outputs
+    finally:
+        inputs_memory.close()
+        outputs_memory.close()
+
+
+def run_calculations_in_processes(
+    calculation: Calculation,
+    arguments: npt.ArrayLike,
+    max_workers: int | None = None,
+    chunk_size: int | None = None,
+    mp_context: BaseContext | None = None,
+) -> np.ndarray:
+    """Run a calculation for many sets of inputs on a process pool.
+
+    For CPU bound replacements of the slow functions, which cannot run in
+    parallel on threads. The inputs and results are held in shared memory,
+    so each worker is only sent the bounds of its chunk rather than the
+    values themselves.
+
+    Parameters
+    ----------
+    calculation
+        The calculation to run, e.g. `CALCULATION_1`.
+    arguments
+        Array of shape (n, number of inputs), one row per invocation. Values
+        and results must fit in 64 bit integers.
+    max_workers
+        Maximum number of processes, passed to `ProcessPoolExecutor`.
+    chunk_size
+        Rows per task. Defaults to splitting the rows into four chunks per
+        worker.
+    mp_context
+        Multiprocessing context, passed to `ProcessPoolExecutor`.
+
+    Returns
+    -------
+    np.ndarray
+        The result of each invocation, in the order of `arguments`.
+
+    Raises
+    ------
+    ValueError
+        If `arguments` does not have one column per calculation input, or
+        `max_workers` or `chunk_size` is given and less than 1.
+    """
+    for name, value in (('max_workers', max_workers), ('chunk_size', chunk_size)):
+        if value is not None and value < 1:
+            raise ValueError(f'{name} must be at least 1, got {name}={value}.')
+    arguments = np.asarray(arguments, dtype=np.int64)
+    if arguments.ndim != 2 or arguments.shape[1] != len(calculation.inputs):
+        raise ValueError(
+            f'arguments must have shape (n, {len(calculation.inputs)}), '
+            f'got {arguments.shape}.'
+        )
+    rows = arguments.shape[0]
+    if rows == 0:
+        return np.empty(0, dtype=np.int64)
+
+    workers = max_workers or os.cpu_count() or 1
+    chunk_size = chunk_size or math.ceil(rows / (workers * 4))
+
+    inputs_memory = SharedMemory(create=True, size=arguments.nbytes)
+    outputs_memory = SharedMemory(create=True, size=rows * 8)
+    try:
+        inputs = np.ndarray(
+            arguments.shape, dtype=np.int64, buffer=inputs_memory.buf,
+        )
+        inputs[:] = arguments
+        del inputs
+
+        with ProcessPoolExecutor(workers, mp_context=mp_context) as executor:
+            futures = [
+                executor.submit(
+                    _evaluate_chunk,
+                    calculation,
+                    inputs_memory.name,
+                    outputs_memory.name,
+                    arguments.shape,
+                    start,
+                    min(start + chunk_size, rows),
+                )
+                for start in range(0, rows, chunk_size)
+            ]
+            for future in futures:
+                future.result()
+
+        outputs = np.ndarray(rows, dtype=np.int64, buffer=outputs_memory.buf)
+        results = outputs.copy()
+        del outputs
+        return results
+    finally:
+        for memory in (inputs_memory, outputs_memory):
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,131 @@
+"""Spark column versions of the example functions.
+
+Each `*_col` function builds a column expression which Spark evaluates in
+the JVM, with no Python worker involved. The `*_udf` functions are pandas
+UDFs wrapping the Python versions, exchanging data with the JVM in Arrow
+batches, for use where a column expression does not fit.
+"""
+import pandas as pd
+import pyspark.sql.types as st
+from pyspark.sql import Column
+from pyspark.sql import functions as F
+
+from examples.example_3 import organise_sequence
+from examples.example_5 import calculate_datetime_delta
+from examples.example_6 import break_string_pattern, count_characters_in_strings
+
+
+ColumnOrName = Column | str
+
+
+def _to_column(value: ColumnOrName) -> Column:
+    return F.col(value) if isinstance(value, str) else value
+
+
+def calculate_datetime_delta_col(
+    date1: ColumnOrName,
+    date2: ColumnOrName,
+) -> Column:
+    """Calculate the difference between two timestamp columns.
+
+    Parameters
+    ----------
+    date1
+        The first timestamp column.
+    date2
+        The second timestamp column.
+
+    Returns
+    -------
+    Column
+        Day-time interval column, collected as `timedelta`.
+    """
+    return _to_column(date1) - _to_column(date2)
+
+
+def break_string_pattern_col(value: ColumnOrName) -> Column:
+    """Break an underscore separated string column into parts.
+
+    Parameters
+    ----------
+    value
+        String column containing `n` underscore characters.
+
+    Returns
+    -------
+    Column
+        Array of strings column.
+    """
+    return F.split(value, '_')
+
+
+def count_characters_in_strings_col(values: ColumnOrName) -> Column:
+    """Count the length of each string in an array column.
+
+    Parameters
+    ----------
+    values
+        Array of strings column.
+
+    Returns
+    -------
+    Column
+        Map column with keys matching the distinct strings in `values`, and
+        values the number of characters in each key.
+    """
+    # Map keys must be unique, where a Python dict keeps the last duplicate.
+    distinct = F.array_distinct(values)
+    return F.map_from_arrays(distinct, F.transform(distinct, F.length))
+
+
+def organise_sequence_col(values: ColumnOrName) -> Column:
+    """Sort an array column.
+
+    Parameters
+    ----------
+    values
+        Array column of values to be sorted, should all be same type.
+
+    Returns
+    -------
+    Column
+        The sorted array column. Nulls, which `organise_sequence` cannot
+        sort, are placed last.
+    """
+    return F.array_sort(values)
+
+
+@F.pandas_udf(st.DayTimeIntervalType())
+def calculate_datetime_delta_udf(date1: pd.Series, date2: pd.Series) -> pd.Series:
+    """Pandas UDF version of `calculate_datetime_delta`."""
+    return pd.Series(
+        [calculate_datetime_delta(a, b) for a, b in zip(date1, date2)],
+        dtype='timedelta64[ns]',
+    )
+
+
+@F.pandas_udf(st.ArrayType(st.StringType()))
+def break_string_pattern_udf(value: pd.Series) -> pd.Series:
+    """Pandas UDF version of `break_string_pattern`."""
+    return value.map(break_string_pattern)
+
+
+@F.pandas_udf(st.MapType(st.StringType(), st.IntegerType()))
+def count_characters_in_strings_udf(values: pd.Series) -> pd.Series:
+    """Pandas UDF version of `count_characters_in_strings`."""
+    return values.map(lambda strings: count_characters_in_strings(list(strings)))
+
+
+def organise_sequence_udf(element_type: st.DataType):
+    """Return a pandas UDF version of `organise_sequence`.
+
+    Parameters
+    ----------
+    element_type
+        Spark type of the array elements, e.g. `IntegerType()`.
+    """
+    @F.pandas_udf(st.ArrayType(element_type))
+    def organise_sequence_udf(values: pd.Series) -> pd.Series:
+        return values.map(lambda sequence: organise_sequence(list(sequence)))
+
+    return organise_sequence_udf
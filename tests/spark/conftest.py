@@ -24,7 +24,5 @@ def spark_session():
         # This stops progress bars appearing in the console whilst running
         .config('spark.ui.showConsoleProgress', 'false')
         # .config('spark.sql.execution.arrow.enabled', 'true')
-        .config('spark.executorEnv.ARROW_PRE_0_15_IPC_FORMAT', 1)
-        .config('spark.workerEnv.ARROW_PRE_0_15_IPC_FORMAT', 1)
         .getOrCreate()
     )
@@ -0,0 +1,117 @@
+from datetime import datetime
+
+import pytest
+import pyspark.sql.types as st
+
+from tests.conftest import Case, parametrize_cases
+
+from examples.example_3 import organise_sequence
+from examples.example_5 import calculate_datetime_delta
+from examples.example_6 import break_string_pattern, count_characters_in_strings
+from examples.spark_functions import (
+    break_string_pattern_col,
+    break_string_pattern_udf,
+    calculate_datetime_delta_col,
+    calculate_datetime_delta_udf,
+    count_characters_in_strings_col,
+    count_characters_in_strings_udf,
+    organise_sequence_col,
+    organise_sequence_udf,
+)
+
+
+@pytest.fixture
+def datetimes_df(spark_session):
+    """Pairs of timestamps, away from any DST change."""
+    return spark_session.createDataFrame(
+        [
+            (datetime(2001, 12, 12), datetime(2001, 12, 11)),
+            (datetime(2001, 12, 11), datetime(2001, 12, 12)),
+            (datetime(2001, 12, 11, 6, 30), datetime(2001, 12, 11)),
+        ],
+        'date1 timestamp, date2 timestamp',
+    )
+
+
+@pytest.fixture
+def strings_df(spark_session):
+    """Underscore separated strings."""
+    return spark_session.createDataFrame(
+        [('abcd',), ('ab_cd',), ('a_b_c_d',), ('a_a',), ('',)],
+        'value string',
+    )
+
+
+@pytest.fixture
+def sequences_df(spark_session):
+    """Arrays of integers to sort."""
+    return spark_session.createDataFrame(
+        [([3, 1, 2],), ([],), ([5, -1, 5, 0],)],
+        'values array<int>',
+    )
+
+
+class TestCalculateDatetimeDeltaCol:
+    """Tests for the calculate_datetime_delta_col function."""
+
+    @parametrize_cases(
+        Case(label='column_expression', func=calculate_datetime_delta_col),
+        Case(label='pandas_udf', func=calculate_datetime_delta_udf),
+    )
+    def test_matches_python(self, datetimes_df, func):
+        """Test the Spark result matches calculate_datetime_delta."""
+        rows = datetimes_df.select(
+            'date1', 'date2', func('date1', 'date2').alias('delta'),
+        ).collect()
+
+        for row in rows:
+            assert row.delta == calculate_datetime_delta(row.date1, row.date2)
+
+
+class TestBreakStringPatternCol:
+    """Tests for the break_string_pattern_col function."""
+
+    @parametrize_cases(
+        Case(label='column_expression', func=break_string_pattern_col),
+        Case(label='pandas_udf', func=break_string_pattern_udf),
+    )
+    def test_matches_python(self, strings_df, func):
+        """Test the Spark result matches break_string_pattern."""
+        rows = strings_df.select('value', func('value').alias('parts')).collect()
+
+        for row in rows:
+            assert row.parts == break_string_pattern(row.value)
+
+
+class TestCountCharactersInStringsCol:
+    """Tests for the count_characters_in_strings_col function."""
+
+    @parametrize_cases(
+        Case(label='column_expression', func=count_characters_in_strings_col),
+        Case(label='pandas_udf', func=count_characters_in_strings_udf),
+    )
+    def test_matches_python(self, strings_df, func):
+        """Test the Spark result matches count_characters_in_strings."""
+        rows = strings_df.select(
+            break_string_pattern_col('value').alias('parts'),
+        ).select('parts', func('parts').alias('counts')).collect()
+
+        for row in rows:
+            assert row.counts == count_characters_in_strings(row.parts)
+
+
+class TestOrganiseSequenceCol:
+    """Tests for the organise_sequence_col function."""
+
+    @parametrize_cases(
+        Case(label='column_expression', func=organise_sequence_col),
+        Case(label='pandas_udf', func=organise_sequence_udf(st.IntegerType())),
+    )
+    def test_matches_python(self, sequences_df, func):
+        """Test the Spark result matches organise_sequence."""
+        rows = sequences_df.select(
+            'values', func('values').alias('sorted'),
+        ).collect()
+
+        for row in rows:
+            assert row.sorted == organise_sequence(row.values)
@@ -0,0 +1,508 @@
+import bisect
+import math
+import random
+import stat
+import struct
+import tempfile
+from unittest import mock
+from dataclasses import dataclass, field
+
+import numpy as np
+import pytest
+
+from tests.conftest import Case, parametrize_cases
+
+from examples import example_3
+from examples.example_3 import (
+    SortKey,
+    SortedSequence,
+    iter_sorted,
+    organise_sequence,
+    organise_sequence_external,
+    organise_sequence_parallel,
+    organise_sequence_topk,
+    organise_record_file,
+)
+
+
+@dataclass(order=True)
+class Record:
+    """Record ordered by key only, to check the sort is stable."""
+
+    key: int
+    position: int = field(compare=False)
+
+
+class TestOrganiseSequence:
+    """Tests for the organise_sequence function."""
+
+    @parametrize_cases(
+        Case(label='ints', values=[3, 1, 2], expected=[1, 2, 3]),
+        Case(label='strings', values=('b', 'c', 'a'), expected=['a', 'b', 'c']),
+        Case(label='empty', values=[], expected=[]),
+        Case(label='iterator', values=iter([2, 1]), expected=[1, 2]),
+    )
+    def test_expected(self, values, expected):
+        """Test the values are returned sorted as a list."""
+        assert organise_sequence(values) == expected
+
+    @parametrize_cases(
+        Case(label='ints', values=[random.randint(-10**12, 10**12) for _ in range(200)]),
+        Case(label='floats', values=[random.uniform(-1, 1) for _ in range(200)] + [-0.0, 0.0]),
+        Case(label='bytes', values=[bytes(random.choices(range(1, 256), k=4)) for _ in range(200)]),
+        Case(label='uint64', values=[2**63 + 1, 2**63 + 5, 1] * 50),
+    )
+    def test_array_path_matches_sorted(self, values, mocker):
+        """Test homogeneous values are sorted as an array, matching sorted."""
+        sort = mocker.spy(np, 'sort')
+
+        actual = organise_sequence(values)
+
+        assert actual == sorted(values)
+        assert [type(value) for value in actual] == [type(values[0])] * len(values)
+        sort.assert_called_once()
+
+    @parametrize_cases(
+        Case(label='mixed_numbers', values=[1, 2.5] * 50),
+        Case(label='bools', values=[True, False] * 50),
+        Case(label='big_ints', values=[2**70, -1] * 50),
+        Case(label='beyond_int64', values=[2**63 + 5, 2**63 + 1, -1] * 50),
+        Case(label='nan', values=[float('nan'), 1.0] * 50),
+        Case(label='strings', values=[str(random.random()) for _ in range(200)]),
+        Case(label='trailing_null', values=[b'a', b'a\0'] * 50),
+        Case(label='uneven_bytes', values=[b'a' * 1000] + [b'b'] * 99),
+        Case(label='tuples', values=[(2, 1), (1, 2)] * 50),
+    )
+    def test_falls_back_to_sorted(self, values, mocker):
+        """Test inputs NumPy would order differently use sorted instead."""
+        sort = mocker.spy(np, 'sort')
+
+        actual = organise_sequence(values)
+
+        assert actual == sorted(values)
+        sort.assert_not_called()
+
+    @parametrize_cases(
+        Case(
+            label='callable',
+            key=lambda r: r.position % 7,
+            expected_key=lambda r: r.position % 7,
+            reverse=False,
+        ),
+        Case(
+            label='descending',
+            key=[SortKey(lambda r: r.key, descending=True)],
+            expected_key=lambda r: r.key,
+            reverse=True,
+        ),
+        Case(
+            label='single_sort_key',
+            key=SortKey(lambda r: r.key, descending=True),
+            expected_key=lambda r: r.key,
+            reverse=True,
+        ),
+        Case(
+            label='multi_key_numeric',
+            key=[SortKey(lambda r: r.key), SortKey(lambda r: -r.position)],
+            expected_key=lambda r: (r.key, -r.position),
+            reverse=False,
+        ),
+        Case(
+            label='multi_key_mixed_directions',
+            key=[
+                SortKey(lambda r: str(r.key), descending=True),
+                SortKey(lambda r: r.position % 5),
+            ],
+            expected_key=lambda r: (-r.key, r.position % 5),
+            reverse=False,
+        ),
+        Case(
+            label='object_keys',
+            key=[SortKey(lambda r: (r.key,), descending=True)],
+            expected_key=lambda r: (r.key,),
+            reverse=True,
+        ),
+    )
+    def test_key(self, key, expected_key, reverse):
+        """Test sorting by keys matches sorted with the equivalent key."""
+        values = [Record(random.randint(0, 5), i) for i in range(100)]
+
+        actual = organise_sequence(values, key=key)
+
+        assert actual == sorted(values, key=expected_key, reverse=reverse)
+        assert [r.position for r in actual] == [
+            r.position for r in sorted(values, key=expected_key, reverse=reverse)
+        ]
+
+    def test_key_beyond_int64(self):
+        """Test int keys beyond int64 are ranked without losing precision."""
+        actual = organise_sequence([2**63 + 5, 2**63 + 1, 1], key=lambda v: v)
+
+        assert actual == [1, 2**63 + 1, 2**63 + 5]
+
+    def test_key_computed_once(self):
+        """Test each key function is called once per value."""
+        key = mock.Mock(side_effect=lambda value: -value)
+
+        actual = organise_sequence([1, 3, 2], key=[SortKey(key), SortKey(abs)])
+
+        assert actual == [3, 2, 1]
+        assert key.call_count == 3
+
+    def test_as_array(self):
+        """Test the sorted array can be returned without list conversion."""
+        actual = organise_sequence([3, 1, 2], as_array=True)
+
+        np.testing.assert_array_equal(actual, np.array([1, 2, 3]))
+
+    def test_as_array_of_tuples(self):
+        """Test values sorted without NumPy give a one dimensional array."""
+        actual = organise_sequence([(2, 1), (1, 2)], as_array=True)
+
+        assert actual.shape == (2,)
+        assert list(actual) == [(1, 2), (2, 1)]
+
+
+class TestOrganiseSequenceExternal:
+    """Tests for the organise_sequence_external function."""
+
+    @parametrize_cases(
+        Case(label='fits_in_one_run', size=50, run_size=100),
+        Case(label='exact_runs', size=100, run_size=10),
+        Case(label='uneven_runs', size=1000, run_size=33),
+        Case(label='empty', size=0, run_size=10),
+    )
+    def test_matches_organise_sequence(self, size, run_size):
+        """Test the streamed output matches sorting in memory."""
+        values = [random.randint(-100, 100) for _ in range(size)]
+
+        actual = organise_sequence_external(
+            iter(values), run_size=run_size, block_size=7,
+        )
+
+        assert list(actual) == organise_sequence(values)
+
+    def test_stable(self):
+        """Test equal values keep their input order across runs."""
+        values = [Record(i % 3, i) for i in range(30)]
+
+        actual = organise_sequence_external(values, run_size=4)
+
+        assert [(r.key, r.position) for r in actual] == [
+            (r.key, r.position) for r in organise_sequence(values)
+        ]
+
+    def test_spills_to_directory(self, tmp_path, mocker):
+        """Test one temporary file is created per run."""
+        temporary_file = mocker.spy(tempfile, 'TemporaryFile')
+
+        actual = list(organise_sequence_external(
+            range(10, 0, -1), run_size=3, directory=tmp_path,
+        ))
+
+        assert actual == list(range(1, 11))
+        assert temporary_file.call_count == 4
+
+    def test_raises_for_invalid_run_size(self):
+        """Test a run_size below 1 is rejected."""
+        with pytest.raises(ValueError, match='must be at least 1'):
+            list(organise_sequence_external([1], run_size=0))
+
+
+class TestOrganiseSequenceParallel:
+    """Tests for the organise_sequence_parallel function."""
+
+    @parametrize_cases(
+        Case(label='ints', values=[random.randint(-50, 50) for _ in range(500)]),
+        Case(label='floats', values=[random.random() for _ in range(500)]),
+        Case(label='all_equal', values=[7] * 100),
+        Case(label='bytes', values=[bytes(random.choices(range(1, 256), k=3)) for _ in range(300)]),
+        Case(label='beyond_int64', values=[2**63 + 5, 2**63 + 1, 1] * 50),
+    )
+    def test_matches_organise_sequence(self, values, mocker):
+        """Test the partitioned sort matches sorting in one process."""
+        pool = mocker.spy(example_3, 'ProcessPoolExecutor')
+
+        actual = organise_sequence_parallel(values, max_workers=3, min_size=0)
+
+        assert actual == organise_sequence(values)
+        pool.assert_called_once()
+
+    def test_stable(self):
+        """Test equal values keep their input order."""
+        values = [0.0, -0.0, 1.0, -0.0] * 50
+
+        actual = organise_sequence_parallel(values, max_workers=2, min_size=0)
+
+        assert [math.copysign(1, value) for value in actual] == [
+            math.copysign(1, value) for value in organise_sequence(values)
+        ]
+
+    @parametrize_cases(
+        Case(label='strings', values=[str(i) for i in range(200, 0, -1)]),
+        Case(label='records', values=[Record(i % 4, i) for i in range(100)]),
+    )
+    def test_non_array_input_skips_pool(self, values, mocker):
+        """Test values which cannot be held in an array are sorted here."""
+        pool = mocker.patch('examples.example_3.ProcessPoolExecutor')
+
+        actual = organise_sequence_parallel(values, max_workers=2, min_size=0)
+
+        assert actual == organise_sequence(values)
+        pool.assert_not_called()
+
+    def test_small_input_skips_pool(self, mocker):
+        """Test inputs below min_size are sorted without a process pool."""
+        pool = mocker.patch('examples.example_3.ProcessPoolExecutor')
+
+        actual = organise_sequence_parallel([3, 1, 2], max_workers=4)
+
+        assert actual == [1, 2, 3]
+        pool.assert_not_called()
+
+
+class TestOrganiseSequenceTopk:
+    """Tests for the organise_sequence_topk function."""
+
+    @parametrize_cases(
+        Case(label='some', k=3),
+        Case(label='none', k=0),
+        Case(label='more_than_available', k=50),
+    )
+    def test_matches_organise_sequence(self, k):
+        """Test the result is the start of the full sort."""
+        values = [random.randint(0, 9) for _ in range(20)]
+
+        actual = organise_sequence_topk(iter(values), k)
+
+        assert actual == organise_sequence(values)[:k]
+
+    def test_stable(self):
+        """Test equal values keep their input order."""
+        values = [Record(i % 2, i) for i in range(10)]
+
+        actual = organise_sequence_topk(values, 4)
+
+        assert [r.position for r in actual] == [0, 2, 4, 6]
+
+
+class TestIterSorted:
+    """Tests for the iter_sorted function."""
+
+    def test_matches_organise_sequence(self):
+        """Test every value is yielded in sorted order."""
+        values = [random.randint(-5, 5) for _ in range(50)]
+
+        actual = iter_sorted(values)
+
+        assert list(actual) == organise_sequence(values)
+
+    def test_stable(self):
+        """Test equal values keep their input order."""
+        values = [Record(i % 3, i) for i in range(12)]
+
+        actual = iter_sorted(values)
+
+        assert [(r.key, r.position) for r in actual] == [
+            (r.key, r.position) for r in organise_sequence(values)
+        ]
+
+    def test_lazy(self):
+        """Test values can be taken one at a time from the generator."""
+        actual = iter_sorted(iter([3, 1, 2]))
+
+        assert next(actual) == 1
+        assert next(actual) == 2
+
+
+class TestSortedSequence:
+    """Tests for the SortedSequence class."""
+
+    @pytest.fixture
+    def values(self):
+        """Random values with plenty of duplicates."""
+        return [random.randint(0, 30) for _ in range(200)]
+
+    def test_add_matches_organise_sequence(self, values):
+        """Test adding one at a time keeps organise_sequence order."""
+        sequence = SortedSequence(load=4)
+        for value in values:
+            sequence.add(value)
+
+        assert list(sequence) == organise_sequence(values)
+        assert list(reversed(sequence)) == organise_sequence(values)[::-1]
+        assert len(sequence) == len(values)
+
+    def test_add_is_stable(self):
+        """Test equal values stay in the order they were added."""
+        values = [Record(i % 3, i) for i in range(30)]
+        sequence = SortedSequence(load=2)
+        for value in values:
+            sequence.add(value)
+
+        assert [(r.key, r.position) for r in sequence] == [
+            (r.key, r.position) for r in organise_sequence(values)
+        ]
+
+    def test_remove(self, values):
+        """Test values are removed one occurrence at a time."""
+        sequence = SortedSequence(values, load=4)
+        expected = organise_sequence(values)
+        for value in values[::2]:
+            sequence.remove(value)
+            expected.remove(value)
+
+        assert list(sequence) == expected
+
+    def test_remove_missing(self):
+        """Test removing a missing value raises like list.remove."""
+        sequence = SortedSequence([1, 3], load=1)
+
+        with pytest.raises(ValueError, match='2 not in SortedSequence'):
+            sequence.remove(2)
+
+    def test_index_and_bisect(self, values):
+        """Test positions match those in the sorted list."""
+        sequence = SortedSequence(values, load=4)
+        expected = organise_sequence(values)
+
+        assert [sequence[i] for i in range(-len(values), len(values))] == expected * 2
+        for value in range(-1, 32):
+            assert sequence.bisect_left(value) == bisect.bisect_left(expected, value)
+            assert sequence.bisect_right(value) == bisect.bisect_right(expected, value)
+            assert (value in sequence) == (value in expected)
+
+    @parametrize_cases(
+        Case(label='closed', minimum=5, maximum=10, inclusive=(True, True)),
+        Case(label='open', minimum=5, maximum=10, inclusive=(False, False)),
+        Case(label='no_minimum', minimum=None, maximum=3, inclusive=(True, True)),
+        Case(label='no_maximum', minimum=28, maximum=None, inclusive=(True, True)),
+        Case(label='empty', minimum=10, maximum=5, inclusive=(True, True)),
+    )
+    def test_irange(self, values, minimum, maximum, inclusive):
+        """Test range queries return the values between the bounds."""
+        sequence = SortedSequence(values, load=4)
+
+        def in_range(value):
+            above = minimum is None or (
+                value >= minimum if inclusive[0] else value > minimum
+            )
+            below = maximum is None or (
+                value <= maximum if inclusive[1] else value < maximum
+            )
+            return above and below
+
+        actual = sequence.irange(minimum, maximum, inclusive)
+
+        assert list(actual) == [v for v in organise_sequence(values) if in_range(v)]
+
+    def test_update(self, values):
+        """Test merging a sorted batch matches adding each value."""
+        sequence = SortedSequence(values[:100], load=4)
+        batch = organise_sequence(values[100:])
+
+        sequence.update(batch)
+        sequence.add(15)
+
+        assert list(sequence) == organise_sequence(values + [15])
+
+    def test_update_unsorted(self):
+        """Test merging a batch which is not sorted is rejected."""
+        with pytest.raises(ValueError, match='must already be sorted'):
+            SortedSequence().update([2, 1])
+
+
+class TestOrganiseRecordFile:
+    """Tests for the organise_record_file function."""
+
+    @pytest.fixture
+    def records(self):
+        """Records of a 4 byte id, an 8 byte little endian key and padding."""
+        return [
+            struct.pack('<iq4x', position, random.randint(-5, 5))
+            for position in range(100)
+        ]
+
+    @staticmethod
+    def sort_key(record):
+        """The key of a record, decoded the slow way."""
+        return struct.unpack_from('<q', record, 4)[0]
+
+    def test_output_file(self, tmp_path, records):
+        """Test the sorted records are written to a new file."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(b''.join(records))
+        output_path = tmp_path / 'sorted.bin'
+
+        organise_record_file(
+            path, record_size=16, key_offset=4, key_dtype='<i8',
+            output_path=output_path, chunk_size=7,
+        )
+
+        expected = b''.join(organise_sequence(records, key=self.sort_key))
+        assert output_path.read_bytes() == expected
+        assert path.read_bytes() == b''.join(records)
+
+    def test_in_place(self, tmp_path, records):
+        """Test the file is replaced by its sorted records."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(b''.join(records))
+
+        organise_record_file(path, record_size=16, key_offset=4, key_dtype='<i8')
+
+        expected = b''.join(organise_sequence(records, key=self.sort_key))
+        assert path.read_bytes() == expected
+        assert [p.name for p in tmp_path.iterdir()] == ['records.bin']
+
+    def test_in_place_keeps_permissions(self, tmp_path, records):
+        """Test the replaced file keeps the mode of the original."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(b''.join(records))
+        path.chmod(0o644)
+
+        organise_record_file(path, record_size=16, key_offset=4, key_dtype='<i8')
+
+        assert stat.S_IMODE(path.stat().st_mode) == 0o644
+
+    def test_output_path_same_as_path(self, tmp_path, records):
+        """Test naming the input as the output sorts it in place."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(b''.join(records))
+
+        organise_record_file(
+            path, record_size=16, key_offset=4, key_dtype='<i8',
+            output_path=tmp_path / '.' / 'records.bin',
+        )
+
+        expected = b''.join(organise_sequence(records, key=self.sort_key))
+        assert path.read_bytes() == expected
+
+    def test_bytes_key(self, tmp_path):
+        """Test fixed width byte string keys sort bytewise."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(b'1cc2aa3bb4ab')
+
+        organise_record_file(path, record_size=3, key_offset=1, key_dtype='S2')
+
+        assert path.read_bytes() == b'2aa4ab3bb1cc'
+
+    def test_empty_file(self, tmp_path):
+        """Test an empty file gives an empty output."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(b'')
+
+        organise_record_file(path, record_size=8, key_offset=0, key_dtype='<i8')
+
+        assert path.read_bytes() == b''
+
+    @parametrize_cases(
+        Case(label='key_too_wide', size=16, record_size=8, key_offset=4, match='does not fit'),
+        Case(label='partial_record', size=20, record_size=8, key_offset=0, match='not a multiple'),
+    )
+    def test_raises(self, tmp_path, size, record_size, key_offset, match):
+        """Test keys outside a record and partial records are rejected."""
+        path = tmp_path / 'records.bin'
+        path.write_bytes(bytes(size))
+
+        with pytest.raises(ValueError, match=match):
+            organise_record_file(path, record_size, key_offset, '<i8')
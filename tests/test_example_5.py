@@ -1,5 +1,9 @@
-from datetime import datetime, timedelta
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 
+import numpy as np
 import pytest
 
 from tests.conftest import (
@@ -7,7 +11,17 @@ from tests.conftest import (
     parametrize_cases,
 )
 
-from examples.example_5 import calculate_datetime_delta
+from examples.example_5 import (
+    calculate_datetime_delta,
+    calculate_datetime_delta_array,
+    calculate_datetime_delta_tz,
+    consecutive_deltas_array,
+    iter_consecutive_deltas,
+    iter_csv_datetime_deltas,
+    iter_jsonl_datetime_deltas,
+    iter_rolling_deltas,
+    localize_to_utc,
+)
 
 
 class TestCalculateDatetimeDelta:
@@ -169,4 +183,368 @@ class TestCalculateDatetimeDelta:
         ```
         """
         actual = calculate_datetime_delta(a, b)
-        assert actual == expected
\ No newline at end of file
+        assert actual == expected
+
+
+class TestCalculateDatetimeDeltaArray:
+    """Tests for the calculate_datetime_delta_array function."""
+
+    @parametrize_cases(
+        Case(
+            label='arrays',
+            a=np.array(['2001-12-12', '2001-12-11'], dtype='datetime64[D]'),
+            b=np.array(['2001-12-11', '2001-12-12'], dtype='datetime64[D]'),
+            expected=np.array([1, -1], dtype='timedelta64[D]'),
+        ),
+        Case(
+            label='array_and_scalar',
+            a=np.array(['2001-12-12', '2001-12-14'], dtype='datetime64[D]'),
+            b=datetime(2001, 12, 11),
+            expected=np.array([1, 3], dtype='timedelta64[D]'),
+        ),
+        Case(
+            label='datetime_objects',
+            a=[datetime(2001, 12, 12, 6)],
+            b=[datetime(2001, 12, 12)],
+            expected=np.array([6], dtype='timedelta64[h]'),
+        ),
+        Case(
+            label='missing_values',
+            a=np.array(['2001-12-12', 'NaT'], dtype='datetime64[s]'),
+            b=np.datetime64('2001-12-11'),
+            expected=np.array([86400, 'NaT'], dtype='timedelta64[s]'),
+        ),
+    )
+    def test_expected(self, a, b, expected):
+        """Test each difference matches calculate_datetime_delta."""
+        actual = calculate_datetime_delta_array(a, b)
+
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_arrow_timestamps(self):
+        """Test pyarrow timestamp arrays are accepted."""
+        pa = pytest.importorskip('pyarrow')
+        a = pa.array([datetime(2001, 12, 12), datetime(2001, 12, 11)])
+
+        actual = calculate_datetime_delta_array(a, datetime(2001, 12, 11))
+
+        assert actual.tolist() == [
+            calculate_datetime_delta(datetime(2001, 12, 12), datetime(2001, 12, 11)),
+            calculate_datetime_delta(datetime(2001, 12, 11), datetime(2001, 12, 11)),
+        ]
+
+
+@pytest.fixture
+def timestamp_rows() -> list[dict[str, str]]:
+    """Rows of ISO-8601 start and end timestamps, with repeats and gaps."""
+    return [
+        {'end': '2001-12-12T00:00:00', 'start': '2001-12-11T00:00:00'},
+        {'end': '2001-12-12T00:00:00', 'start': '2001-12-11T12:00:00'},
+        {'end': '2001-12-12', 'start': ''},
+        {'end': '2001-12-12T01:00:00+01:00', 'start': '2001-12-11T00:00:00Z'},
+        {'end': '2001-12-11T00:00:00.250000', 'start': '2001-12-11T00:00:00'},
+    ]
+
+
+@pytest.fixture
+def expected_deltas() -> list:
+    """The deltas for `timestamp_rows`, as `calculate_datetime_delta` gives."""
+    return [
+        timedelta(days=1),
+        timedelta(hours=12),
+        None,
+        timedelta(days=1),
+        timedelta(milliseconds=250),
+    ]
+
+
+def as_timedeltas(chunks) -> list:
+    """Flatten chunks of timedelta64 into Python timedeltas, with None for NaT."""
+    return [
+        None if np.isnat(delta) else delta.item()
+        for chunk in chunks for delta in chunk
+    ]
+
+
+class TestIterCsvDatetimeDeltas:
+    """Tests for the iter_csv_datetime_deltas function."""
+
+    def test_expected(self, tmp_path, timestamp_rows, expected_deltas):
+        """Test the deltas are streamed in chunks from a CSV file."""
+        path = tmp_path / 'events.csv'
+        path.write_text(
+            'end,start\n'
+            + ''.join(f"{row['end']},{row['start']}\n" for row in timestamp_rows)
+        )
+
+        chunks = list(iter_csv_datetime_deltas(path, 'end', 'start', chunk_size=2))
+
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert as_timedeltas(chunks) == expected_deltas
+
+    def test_parses_repeated_strings_once(self, mocker):
+        """Test each distinct timestamp string is only parsed once."""
+        array = mocker.spy(np, 'array')
+        file = io.StringIO('end,start\n' + '2001-12-12,2001-12-11\n' * 10)
+
+        chunks = list(iter_csv_datetime_deltas(file, 'end', 'start', chunk_size=4))
+
+        assert as_timedeltas(chunks) == [timedelta(days=1)] * 10
+        parsed = [call.args[0] for call in array.call_args_list]
+        assert sorted(value for values in parsed for value in values) == [
+            '2001-12-11', '2001-12-12',
+        ]
+
+    def test_small_cache(self):
+        """Test values cached before the cache is emptied are still found."""
+        file = io.StringIO(
+            'end,start\n'
+            '2001-12-02,2001-12-01\n'
+            '2001-12-04,2001-12-01\n'
+            '2001-12-05,2001-12-03\n'
+            '2001-12-01,2001-12-03\n'
+        )
+
+        chunks = iter_csv_datetime_deltas(
+            file, 'end', 'start', chunk_size=2, cache_size=1,
+        )
+
+        assert as_timedeltas(chunks) == [
+            timedelta(days=1), timedelta(days=3), timedelta(days=2), timedelta(days=-2),
+        ]
+
+    def test_raises_for_invalid_chunk_size(self):
+        """Test a chunk_size below 1 is rejected."""
+        with pytest.raises(ValueError, match='chunk_size must be at least 1'):
+            list(iter_csv_datetime_deltas(io.StringIO('a,b\n'), 'a', 'b', chunk_size=0))
+
+    @parametrize_cases(
+        Case(label='word', row='now,2020-01-01'),
+        Case(label='year_only', row='2020-01-02,2020'),
+        Case(label='invalid_month', row='2020-13-01,2020-01-01'),
+    )
+    def test_raises_for_invalid_timestamp(self, row):
+        """Test strings which are not ISO-8601 timestamps are rejected."""
+        file = io.StringIO(f'end,start\n{row}\n')
+
+        with pytest.raises(ValueError):
+            list(iter_csv_datetime_deltas(file, 'end', 'start'))
+
+    def test_raises_for_unknown_column(self):
+        """Test a column missing from the header is rejected, not read as NaT."""
+        file = io.StringIO('start,end\n2020-01-01,2020-01-02\n')
+
+        with pytest.raises(KeyError, match='ennd'):
+            list(iter_csv_datetime_deltas(file, 'start', 'ennd'))
+
+
+class TestIterJsonlDatetimeDeltas:
+    """Tests for the iter_jsonl_datetime_deltas function."""
+
+    def test_expected(self, timestamp_rows, expected_deltas):
+        """Test the deltas are streamed in chunks from JSON lines."""
+        timestamp_rows[2]['start'] = None
+        file = io.StringIO(''.join(json.dumps(row) + '\n' for row in timestamp_rows))
+
+        chunks = list(iter_jsonl_datetime_deltas(file, 'end', 'start', chunk_size=3))
+
+        assert [len(chunk) for chunk in chunks] == [3, 2]
+        assert as_timedeltas(chunks) == expected_deltas
+
+    def test_raises_for_missing_field(self):
+        """Test a missing field is rejected, where an explicit null gives NaT."""
+        file = io.StringIO('{"start": "2020-01-01", "end": null}\n{"start": "2020-01-01"}\n')
+
+        with pytest.raises(KeyError, match='end'):
+            list(iter_jsonl_datetime_deltas(file, 'start', 'end'))
+
+
+@pytest.fixture
+def events() -> list[tuple[str, datetime]]:
+    """Events for two interleaved entities, in time order."""
+    return [
+        ('a', datetime(2001, 12, 11, 0)),
+        ('b', datetime(2001, 12, 11, 1)),
+        ('a', datetime(2001, 12, 11, 2)),
+        ('a', datetime(2001, 12, 11, 7)),
+        ('b', datetime(2001, 12, 11, 9)),
+        ('a', datetime(2001, 12, 11, 8)),
+        ('a', datetime(2001, 12, 11, 11)),
+    ]
+
+
+class TestIterConsecutiveDeltas:
+    """Tests for the iter_consecutive_deltas function."""
+
+    def test_expected(self, events):
+        """Test each gap is measured from the previous event for the key."""
+        actual = [delta for _, _, delta in iter_consecutive_deltas(events)]
+
+        assert actual == [
+            None, None, timedelta(hours=2), timedelta(hours=5),
+            timedelta(hours=8), timedelta(hours=1), timedelta(hours=3),
+        ]
+
+    def test_raises_for_unsorted(self):
+        """Test events out of order for a key are rejected."""
+        events = [('a', datetime(2001, 12, 12)), ('a', datetime(2001, 12, 11))]
+
+        with pytest.raises(ValueError, match="key='a' are not in time order"):
+            list(iter_consecutive_deltas(events))
+
+
+class TestIterRollingDeltas:
+    """Tests for the iter_rolling_deltas function."""
+
+    def test_expected(self, events):
+        """Test spans and max gaps cover the last `window` events per key."""
+        actual = [
+            (key, span, max_gap)
+            for key, _, span, max_gap in iter_rolling_deltas(events, window=3)
+        ]
+
+        assert actual == [
+            ('a', timedelta(0), None),
+            ('b', timedelta(0), None),
+            ('a', timedelta(hours=2), timedelta(hours=2)),
+            ('a', timedelta(hours=7), timedelta(hours=5)),
+            ('b', timedelta(hours=8), timedelta(hours=8)),
+            ('a', timedelta(hours=6), timedelta(hours=5)),
+            ('a', timedelta(hours=4), timedelta(hours=3)),
+        ]
+
+    def test_window_of_one(self, events):
+        """Test a window of one event has no gaps."""
+        actual = list(iter_rolling_deltas(events, window=1))
+
+        assert all(span == timedelta(0) and gap is None for _, _, span, gap in actual)
+
+    def test_raises_for_invalid_window(self, events):
+        """Test a window below 1 is rejected."""
+        with pytest.raises(ValueError, match='window must be at least 1'):
+            list(iter_rolling_deltas(events, window=0))
+
+
+class TestConsecutiveDeltasArray:
+    """Tests for the consecutive_deltas_array function."""
+
+    def test_matches_generator(self, events):
+        """Test the array version matches iter_consecutive_deltas."""
+        keys, timestamps = zip(*events)
+
+        actual = consecutive_deltas_array(keys, timestamps)
+
+        assert [None if np.isnat(d) else d.item() for d in actual] == [
+            delta for _, _, delta in iter_consecutive_deltas(events)
+        ]
+
+    def test_raises_for_unsorted(self):
+        """Test events out of order for a key are rejected."""
+        with pytest.raises(ValueError, match='not in time order'):
+            consecutive_deltas_array(
+                [1, 2, 1],
+                np.array(['2001-12-12', '2001-12-10', '2001-12-11'], dtype='datetime64[D]'),
+            )
+
+
+LONDON = ZoneInfo('Europe/London')
+
+
+class TestCalculateDatetimeDeltaNaiveTimezone:
+    """Tests for calculate_datetime_delta when normalising timezones."""
+
+    @parametrize_cases(
+        Case(
+            label='across_dst_in_one_zone',
+            a=datetime(2021, 3, 28, 3, tzinfo=LONDON),
+            b=datetime(2021, 3, 28, 0, tzinfo=LONDON),
+            expected=timedelta(hours=2),
+        ),
+        Case(
+            label='naive_and_aware',
+            a=datetime(2021, 7, 1, 12, tzinfo=timezone.utc),
+            b=datetime(2021, 7, 1, 12),
+            expected=timedelta(hours=1),
+        ),
+        Case(
+            label='different_zones',
+            a=datetime(2021, 7, 1, 12, tzinfo=ZoneInfo('America/New_York')),
+            b=datetime(2021, 7, 1, 12, tzinfo=LONDON),
+            expected=timedelta(hours=5),
+        ),
+    )
+    def test_expected(self, a, b, expected):
+        """Test the elapsed time is returned, whatever the zones."""
+        actual = calculate_datetime_delta(a, b, naive_timezone=LONDON)
+
+        assert actual == expected
+
+
+def to_utc_slowly(value: datetime, zone: str) -> datetime:
+    """Convert a naive local time to naive UTC one object at a time."""
+    utc = value.replace(tzinfo=ZoneInfo(zone)).astimezone(timezone.utc)
+    return utc.replace(tzinfo=None)
+
+
+class TestLocalizeToUtc:
+    """Tests for the localize_to_utc function."""
+
+    @parametrize_cases(
+        Case(label='winter', value=datetime(2021, 1, 1, 12)),
+        Case(label='summer', value=datetime(2021, 7, 1, 12)),
+        Case(label='before_gap', value=datetime(2021, 3, 28, 0, 59, 59)),
+        Case(label='in_gap', value=datetime(2021, 3, 28, 1, 30)),
+        Case(label='after_gap', value=datetime(2021, 3, 28, 2)),
+        Case(label='ambiguous', value=datetime(2021, 10, 31, 1, 30)),
+        Case(label='after_overlap', value=datetime(2021, 10, 31, 2)),
+    )
+    def test_matches_zoneinfo(self, value):
+        """Test each time matches conversion with zoneinfo and fold=0."""
+        actual = localize_to_utc(np.array([value], dtype='datetime64[s]'), 'Europe/London')
+
+        assert actual[0].item() == to_utc_slowly(value, 'Europe/London')
+
+    def test_array_of_zones(self):
+        """Test each value is converted using its own zone."""
+        values = [datetime(2021, 3, 28, 1, 30) + timedelta(days=d * 40) for d in range(9)]
+        zones = ['Europe/London', 'America/New_York', 'Australia/Lord_Howe'] * 3
+
+        actual = localize_to_utc(values, zones)
+
+        assert [value.item() for value in actual] == [
+            to_utc_slowly(value, zone) for value, zone in zip(values, zones)
+        ]
+
+    def test_missing_values(self):
+        """Test NaT passes through unchanged."""
+        values = np.array(['NaT', '2021-07-01T12:00'], dtype='datetime64[m]')
+
+        actual = localize_to_utc(values, LONDON)
+
+        assert np.isnat(actual[0])
+        assert actual[1] == np.datetime64('2021-07-01T11:00')
+
+
+class TestCalculateDatetimeDeltaTz:
+    """Tests for the calculate_datetime_delta_tz function."""
+
+    def test_across_dst(self):
+        """Test elapsed time is correct across a DST change."""
+        actual = calculate_datetime_delta_tz(
+            np.array(['2021-03-28T03:00'], dtype='datetime64[s]'),
+            'Europe/London',
+            np.array(['2021-03-28T00:00'], dtype='datetime64[s]'),
+        )
+
+        assert actual[0] == np.timedelta64(2, 'h')
+
+    def test_between_zones(self):
+        """Test each side is converted using its own zone."""
+        actual = calculate_datetime_delta_tz(
+            [datetime(2021, 7, 1, 12)],
+            'America/New_York',
+            [datetime(2021, 7, 1, 12)],
+            ['Europe/London'],
+        )
+
+        assert actual[0] == np.timedelta64(5, 'h')
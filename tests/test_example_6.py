@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 
 from tests.conftest import (
@@ -6,8 +7,12 @@ from tests.conftest import (
 )
 
 from examples.example_6 import (
+    StringPatternFile,
+    TokenVocabulary,
     break_string_pattern,
+    break_string_patterns,
     count_characters_in_strings,
+    count_characters_in_strings_array,
 )
 
 
@@ -167,4 +172,225 @@ class TestRemoveCharactersInString:
 
     @pytest.mark.skip(reason='No test implemented')
     def test_expected(self):
-        pass
\ No newline at end of file
+        pass
+
+
+class TestStringPatternFile:
+    """Tests for the StringPatternFile class."""
+
+    @pytest.fixture
+    def keys_path(self, tmp_path):
+        """File of underscore separated keys, one per line."""
+        path = tmp_path / 'keys.txt'
+        path.write_bytes('abcd\nab_cd\na_b_c_d\n\nnö_rth\n_x_'.encode())
+        return path
+
+    @pytest.fixture
+    def expected(self):
+        """The keys in `keys_path` broken with break_string_pattern."""
+        return [
+            break_string_pattern(value)
+            for value in ['abcd', 'ab_cd', 'a_b_c_d', '', 'nö_rth', '_x_']
+        ]
+
+    @parametrize_cases(
+        Case(label='one_block', block_size=1 << 16),
+        Case(label='block_per_line', block_size=1),
+        Case(label='split_blocks', block_size=7),
+    )
+    def test_offsets_match_break_string_pattern(self, keys_path, expected, block_size):
+        """Test decoding each offset pair gives the same parts."""
+        with StringPatternFile(keys_path, block_size=block_size) as keys:
+            actual = [
+                [keys.decode(start, stop) for start, stop in parts]
+                for parts in keys.iter_offsets()
+            ]
+
+        assert actual == expected
+
+    def test_offset_arrays(self, keys_path, expected):
+        """Test each block gives the offsets of its parts as arrays."""
+        with StringPatternFile(keys_path, block_size=12) as keys:
+            actual = []
+            for starts, stops, lines in keys.iter_offset_arrays():
+                for first, last in zip(lines[:-1], lines[1:]):
+                    actual.append([
+                        keys.decode(start, stop)
+                        for start, stop in zip(starts[first:last], stops[first:last])
+                    ])
+
+        assert actual == expected
+
+    def test_scans_mapped_file_in_place(self, tmp_path, mocker):
+        """Test each block is read from the mapping itself, not a copy."""
+        path = tmp_path / 'keys.txt'
+        path.write_text('\n'.join(['ab_cde_f', 'ghi', 'j_kl'] * 1000))
+        # Wrapped rather than spied on, so the returned views are not kept.
+        frombuffer = mocker.patch.object(np, 'frombuffer', wraps=np.frombuffer)
+
+        with StringPatternFile(path, block_size=8192) as keys:
+            lines = sum(len(lines) - 1 for _, _, lines in keys.iter_offset_arrays())
+            buffers = [call.args[0] for call in frombuffer.call_args_list]
+
+            assert lines == 3000
+            assert 1 < len(buffers) < 10
+            assert all(buffer is keys._buffer for buffer in buffers)
+
+    def test_parts_are_memoryviews(self, keys_path, expected):
+        """Test parts are given as memoryviews without decoding."""
+        with StringPatternFile(keys_path) as keys:
+            actual = []
+            for parts in keys.iter_parts():
+                assert all(isinstance(part, memoryview) for part in parts)
+                actual.append([bytes(part).decode() for part in parts])
+                for part in parts:
+                    part.release()
+
+        assert actual == expected
+
+    def test_empty_file(self, tmp_path):
+        """Test an empty file has no lines."""
+        path = tmp_path / 'keys.txt'
+        path.write_bytes(b'')
+
+        with StringPatternFile(path) as keys:
+            assert list(keys.iter_offsets()) == []
+
+    def test_custom_separators(self, tmp_path):
+        """Test other delimiters and line separators can be used."""
+        path = tmp_path / 'keys.txt'
+        path.write_bytes(b'a::b\r\nc')
+
+        with StringPatternFile(path, delimiter=b'::', line_separator=b'\r\n') as keys:
+            actual = [
+                [keys.decode(*offsets) for offsets in parts]
+                for parts in keys.iter_offsets()
+            ]
+
+        assert actual == [['a', 'b'], ['c']]
+
+
+class TestCountCharactersInStringsArray:
+    """Tests for the count_characters_in_strings_array function."""
+
+    @pytest.fixture
+    def strings(self) -> list[str]:
+        """Strings including multi-byte characters and an empty string."""
+        return ['abcd', 'ab', 'ñö', '', '日本語x']
+
+    @parametrize_cases(
+        Case(label='list', to_input=list),
+        Case(label='numpy_fixed_width', to_input=np.array),
+        Case(label='numpy_object', to_input=lambda values: np.array(values, dtype=object)),
+    )
+    def test_matches_count_characters_in_strings(self, strings, to_input):
+        """Test each length matches the dictionary version."""
+        actual = count_characters_in_strings_array(to_input(strings))
+
+        expected = count_characters_in_strings(strings)
+        np.testing.assert_array_equal(actual, [expected[value] for value in strings])
+
+    def test_bytes_array(self, strings):
+        """Test bytes arrays are decoded, counting characters not bytes."""
+        values = np.array([string.encode() for string in strings])
+
+        assert count_characters_in_strings_array(values).tolist() == [
+            len(string) for string in strings
+        ]
+        assert count_characters_in_strings_array(values, as_dict=True) == (
+            count_characters_in_strings(strings)
+        )
+
+    def test_as_dict(self, strings):
+        """Test the dictionary output matches count_characters_in_strings."""
+        actual = count_characters_in_strings_array(np.array(strings), as_dict=True)
+
+        assert actual == count_characters_in_strings(strings)
+
+    @parametrize_cases(
+        Case(label='string', arrow_type='string', slice_from=0),
+        Case(label='large_string', arrow_type='large_string', slice_from=0),
+        Case(label='sliced', arrow_type='string', slice_from=2),
+    )
+    def test_arrow(self, strings, arrow_type, slice_from):
+        """Test lengths are taken from Arrow buffers, with nulls as 0."""
+        pa = pytest.importorskip('pyarrow')
+        values = strings + [None]
+        array = pa.array(values, type=getattr(pa, arrow_type)())[slice_from:]
+
+        actual = count_characters_in_strings_array(array)
+
+        np.testing.assert_array_equal(
+            actual, [len(value or '') for value in values[slice_from:]],
+        )
+
+    @parametrize_cases(
+        Case(label='dictionary', arrow_type=('dictionary', 'int32', 'string')),
+        Case(label='binary', arrow_type=('binary',)),
+    )
+    def test_arrow_other_types(self, strings, arrow_type):
+        """Test arrays which are not plain strings are still measured."""
+        pa = pytest.importorskip('pyarrow')
+        name, *args = arrow_type
+        array = pa.array(strings + [None]).cast(
+            getattr(pa, name)(*(getattr(pa, arg)() for arg in args)),
+        )
+
+        actual = count_characters_in_strings_array(array)
+
+        np.testing.assert_array_equal(
+            actual, [len(value) for value in array.to_pylist()[:-1]] + [0],
+        )
+
+    def test_arrow_chunked_as_dict(self, strings):
+        """Test chunked arrays are supported and nulls left out of the dict."""
+        pa = pytest.importorskip('pyarrow')
+        array = pa.chunked_array([strings[:2], strings[2:] + [None]])
+
+        actual = count_characters_in_strings_array(array, as_dict=True)
+
+        assert actual == count_characters_in_strings(strings)
+
+
+class TestBreakStringPatterns:
+    """Tests for the break_string_patterns function."""
+
+    @pytest.fixture
+    def keys(self) -> list[str]:
+        """Keys repeating a few tokens."""
+        return ['north_shoes_jan', 'south_shoes_jan', 'north_hats', '', 'jan']
+
+    def test_rows_match_break_string_pattern(self, keys):
+        """Test each row gives back the parts of its string."""
+        actual = break_string_patterns(keys)
+
+        assert len(actual) == len(keys)
+        assert [actual[row] for row in range(len(keys))] == [
+            break_string_pattern(key) for key in keys
+        ]
+
+    def test_tokens_interned(self, keys):
+        """Test each distinct token is stored once."""
+        actual = break_string_patterns(keys)
+
+        np.testing.assert_array_equal(actual.token_ids, [0, 1, 2, 3, 1, 2, 0, 4, 5, 2])
+        np.testing.assert_array_equal(actual.offsets, [0, 3, 6, 8, 9, 10])
+        assert len(actual.vocabulary) == 6
+
+    def test_shared_vocabulary(self, keys):
+        """Test IDs are consistent across batches sharing a vocabulary."""
+        vocabulary = TokenVocabulary(['jan'])
+
+        first = break_string_patterns(keys[:2], vocabulary)
+        second = break_string_patterns(keys[2:], vocabulary)
+
+        np.testing.assert_array_equal(first.row_ids(0), [1, 2, 0])
+        np.testing.assert_array_equal(second.row_ids(2), [0])
+        assert second[0] == ['north', 'hats']
+
+    def test_empty(self):
+        """Test no strings gives no rows."""
+        actual = break_string_patterns([])
+
+        assert len(actual) == 0
+        assert actual.token_ids.shape == (0,)
@@ -1,15 +1,65 @@
+import asyncio
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
 from unittest import mock
 
+import numpy as np
 import pytest
 
 from tests.conftest import Case, parametrize_cases
 
 from examples.example_7 import(
+    CALCULATION_1,
+    CALCULATION_2,
+    Calculation,
+    CalculationStep,
+    ChromeTraceSink,
+    IncrementalCalculation,
+    JsonlSink,
+    OperandCache,
+    PartialResult,
+    RingBufferSink,
+    SingleFlight,
     complex_calculation_1,
+    complex_calculation_1_async,
+    complex_calculation_1_batch,
     complex_calculation_2,
+    complex_calculation_2_async,
+    complex_calculation_2_batch,
+    fuse_calculation,
+    resume_calculation,
+    run_calculations_concurrently,
+    run_calculations_in_processes,
+    run_with_deadline,
+    run_with_concurrency_limit,
+    slow_add_batch,
+    slow_multiply_batch,
+    tracing,
 )
 
 
+@pytest.fixture
+def fast_sleep(mocker):
+    """Replace the 10 second sleep in the slow functions with a short one."""
+    return mocker.patch(
+        'examples.example_7.sleep', side_effect=lambda seconds: sleep(0.05),
+    )
+
+
+@pytest.fixture
+def fast_async_sleep(mocker):
+    """Replace the 10 second asyncio sleep in the async functions with a short one."""
+    real_sleep = asyncio.sleep
+
+    async def short_sleep(seconds):
+        await real_sleep(0.05)
+
+    return mocker.patch('examples.example_7.asyncio.sleep', side_effect=short_sleep)
+
+
 class TestComplexCalculation1:
     """Tests for the complex_calculation_1 function."""
 
@@ -501,4 +551,857 @@ class TestComplexCalculation2:
 
         actual = complex_calculation_2(a, b, c)
 
-        assert actual == expected
\ No newline at end of file
+        assert actual == expected
+
+
+class TestCalculation:
+    """Tests for the Calculation class."""
+
+    @parametrize_cases(
+        Case(label='calculation_1', calculation=CALCULATION_1, args=(2, 3), expected=13),
+        Case(label='calculation_2', calculation=CALCULATION_2, args=(10, 20, 1), expected=209),
+    )
+    def test_evaluate(self, fast_sleep, calculation, args, expected):
+        """Test the steps give the same result as the documented formula."""
+        assert calculation.evaluate(*args) == expected
+
+    def test_evaluate_uses_patched_functions(self, mocker):
+        """Test steps look up the slow functions at call time."""
+        mocker.patch('examples.example_7.slow_add', side_effect=[6, 14])
+        mocker.patch('examples.example_7.slow_multiply', return_value=12)
+
+        assert CALCULATION_1.evaluate(2, 3) == 13
+
+
+class TestRunCalculationsConcurrently:
+    """Tests for the run_calculations_concurrently function."""
+
+    @parametrize_cases(
+        Case(
+            label='calculation_1',
+            calculation=CALCULATION_1,
+            arguments=[(2, 3), (0, 0), (-4, 7)],
+            expected=[13, -1, -21],
+        ),
+        Case(
+            label='calculation_2',
+            calculation=CALCULATION_2,
+            arguments=[(1, 1, 1), (10, 20, 1), (3, -2, 5)],
+            expected=[1, 209, -8],
+        ),
+    )
+    def test_expected(self, fast_sleep, calculation, arguments, expected):
+        """Test results are returned in the order of the arguments."""
+        actual = run_calculations_concurrently(calculation, arguments)
+
+        assert actual == expected
+
+    def test_invocations_overlap(self, fast_sleep):
+        """Test wall time follows the critical path, not the number of inputs."""
+        arguments = [(a, a + 1) for a in range(20)]
+
+        start = perf_counter()
+        actual = run_calculations_concurrently(
+            CALCULATION_1, arguments, max_workers=20,
+        )
+        elapsed = perf_counter() - start
+
+        assert actual == [a + a * ((a + 1) + b) - 1 for a, b in arguments]
+        # 3 slow steps on the critical path, against 60 if run one by one.
+        assert elapsed < 20 * 3 * 0.05 / 2
+
+    def test_raises_step_error(self, mocker):
+        """Test an exception from a step is raised to the caller."""
+        mocker.patch(
+            'examples.example_7.slow_multiply',
+            side_effect=ZeroDivisionError('boom'),
+        )
+        mocker.patch('examples.example_7.slow_add', side_effect=lambda a, b: a + b)
+
+        with pytest.raises(ZeroDivisionError, match='boom'):
+            run_calculations_concurrently(CALCULATION_2, [(1, 2, 3)])
+
+
+class TestSlowAddBatch:
+    """Tests for the slow_add_batch function."""
+
+    def test_sleeps_once_per_batch(self, fast_sleep):
+        """Test the whole array is added for the cost of one call."""
+        actual = slow_add_batch(np.array([1, 2, 3]), np.array([10, 20, 30]))
+
+        np.testing.assert_array_equal(actual, [11, 22, 33])
+        fast_sleep.assert_called_once_with(10)
+
+
+class TestSlowMultiplyBatch:
+    """Tests for the slow_multiply_batch function."""
+
+    def test_sleeps_once_per_batch(self, fast_sleep):
+        """Test the whole array is multiplied for the cost of one call."""
+        actual = slow_multiply_batch(np.array([1, 2, 3]), 2)
+
+        np.testing.assert_array_equal(actual, [2, 4, 6])
+        fast_sleep.assert_called_once_with(10)
+
+
+class TestComplexCalculation1Batch:
+    """Tests for the complex_calculation_1_batch function."""
+
+    def test_matches_scalar_version(self, fast_sleep):
+        """Test each element matches the documented scalar formula."""
+        a = np.array([2, 0, -4, 7])
+        b = np.array([3, 0, 7, -1])
+
+        actual = complex_calculation_1_batch(a, b)
+
+        np.testing.assert_array_equal(actual, a + a * ((a + 1) + b) - 1)
+        assert fast_sleep.call_count == 3
+
+
+class TestComplexCalculation2Batch:
+    """Tests for the complex_calculation_2_batch function."""
+
+    def test_matches_scalar_version(self, fast_sleep):
+        """Test each element matches the documented scalar formula."""
+        a = np.array([1, 10, 3])
+        b = np.array([1, 20, -2])
+        c = np.array([1, 1, 5])
+
+        actual = complex_calculation_2_batch(a, b, c)
+
+        np.testing.assert_array_equal(actual, [1, 209, -8])
+        assert fast_sleep.call_count == 2
+
+
+class TestComplexCalculation1Async:
+    """Tests for the complex_calculation_1_async function."""
+
+    @parametrize_cases(
+        Case(label='small_values', a=2, b=3, expected=13),
+        Case(label='negative_values', a=-4, b=7, expected=-21),
+    )
+    def test_expected(self, fast_async_sleep, a, b, expected):
+        """Test the result matches the sync version."""
+        actual = asyncio.run(complex_calculation_1_async(a, b))
+
+        assert actual == expected
+        assert fast_async_sleep.call_count == 3
+
+
+class TestComplexCalculation2Async:
+    """Tests for the complex_calculation_2_async function."""
+
+    @parametrize_cases(
+        Case(label='small_values', a=1, b=1, c=1, expected=1),
+        Case(label='larger_values', a=10, b=20, c=1, expected=209),
+    )
+    def test_expected(self, fast_async_sleep, a, b, c, expected):
+        """Test the result matches the sync version."""
+        actual = asyncio.run(complex_calculation_2_async(a, b, c))
+
+        assert actual == expected
+        assert fast_async_sleep.call_count == 2
+
+
+class TestRunWithConcurrencyLimit:
+    """Tests for the run_with_concurrency_limit function."""
+
+    def test_results_in_input_order(self, fast_async_sleep):
+        """Test many calls share the event loop and keep their order."""
+        arguments = [(a, -a, a % 7) for a in range(500)]
+
+        start = perf_counter()
+        actual = asyncio.run(
+            run_with_concurrency_limit(complex_calculation_2_async, arguments)
+        )
+        elapsed = perf_counter() - start
+
+        assert actual == [(a * b + a) - c for a, b, c in arguments]
+        assert elapsed < 1
+
+    def test_limits_calls_in_flight(self):
+        """Test no more than `limit` calls run at the same time."""
+        in_flight = 0
+        peak = 0
+
+        async def tracked(value):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return value
+
+        arguments = [(value,) for value in range(20)]
+        actual = asyncio.run(
+            run_with_concurrency_limit(tracked, arguments, limit=3)
+        )
+
+        assert actual == list(range(20))
+        assert peak == 3
+
+    def test_raises_call_error(self):
+        """Test an exception from a call is raised to the caller."""
+        async def failing(value):
+            raise ValueError(f'bad {value}')
+
+        with pytest.raises(ValueError, match='bad 0'):
+            asyncio.run(run_with_concurrency_limit(failing, [(0,)]))
+
+    def test_raises_for_invalid_limit(self):
+        """Test a limit below 1 is rejected."""
+        with pytest.raises(ValueError, match='limit must be at least 1'):
+            asyncio.run(
+                run_with_concurrency_limit(complex_calculation_2_async, [], limit=0)
+            )
+
+
+class TestOperandCache:
+    """Tests for the OperandCache class."""
+
+    @pytest.fixture
+    def add(self):
+        """Stand in for a slow function, counting its calls."""
+        return mock.Mock(side_effect=lambda a, b: a + b)
+
+    def test_counts_hits_and_misses(self, add):
+        """Test repeated operands are only computed once."""
+        cache = OperandCache()
+
+        results = [cache.get_or_compute('add', add, 1, 2) for _ in range(3)]
+
+        assert results == [3, 3, 3]
+        assert add.call_count == 1
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_evicts_least_recently_used(self, add):
+        """Test the memory tier keeps at most `max_size` entries."""
+        cache = OperandCache(max_size=2)
+
+        cache.get_or_compute('add', add, 1, 1)
+        cache.get_or_compute('add', add, 2, 2)
+        cache.get_or_compute('add', add, 1, 1)  # 1, 1 is now most recent
+        cache.get_or_compute('add', add, 3, 3)  # evicts 2, 2
+        cache.get_or_compute('add', add, 1, 1)
+        cache.get_or_compute('add', add, 2, 2)
+
+        assert add.call_count == 4
+
+    def test_expires_after_ttl(self, add, mocker):
+        """Test entries older than `ttl` are computed again."""
+        clock = mocker.patch('examples.example_7.time', return_value=100.0)
+        cache = OperandCache(ttl=5)
+
+        cache.get_or_compute('add', add, 1, 2)
+        clock.return_value = 104.0
+        cache.get_or_compute('add', add, 1, 2)
+        clock.return_value = 106.0
+        cache.get_or_compute('add', add, 1, 2)
+
+        assert add.call_count == 2
+
+    def test_disk_tier_survives_restart(self, add, tmp_path):
+        """Test a new cache on the same path starts warm."""
+        path = str(tmp_path / 'cache.sqlite')
+        cache = OperandCache(path=path)
+        cache.get_or_compute('add', add, 2**70, 1)
+        cache.close()
+
+        cache = OperandCache(path=path)
+        actual = cache.get_or_compute('add', add, 2**70, 1)
+
+        assert actual == 2**70 + 1
+        assert add.call_count == 1
+        assert cache.hits == 1
+
+    def test_disk_tier_max_size(self, add, tmp_path, mocker):
+        """Test the disk tier evicts its oldest entries."""
+        clock = mocker.patch('examples.example_7.time', return_value=0.0)
+        path = str(tmp_path / 'cache.sqlite')
+        cache = OperandCache(max_size=1, path=path, max_disk_size=2)
+        for value in range(3):
+            clock.return_value = float(value)
+            cache.get_or_compute('add', add, value, value)
+
+        cache.get_or_compute('add', add, 2, 2)  # memory hit
+        cache.get_or_compute('add', add, 1, 1)  # disk hit
+        cache.get_or_compute('add', add, 0, 0)  # evicted
+
+        assert add.call_count == 4
+
+    def test_enabled_caches_calculations(self, mocker):
+        """Test complex calculations reuse cached slow function results."""
+        slow_add = mocker.patch(
+            'examples.example_7.slow_add', side_effect=lambda a, b: a + b,
+        )
+        mocker.patch(
+            'examples.example_7.slow_multiply', side_effect=lambda a, b: a * b,
+        )
+        cache = OperandCache()
+
+        with cache.enabled():
+            first = complex_calculation_1(2, 3)
+            second = complex_calculation_1(2, 3)
+
+        assert first == second == 13
+        assert slow_add.call_count == 2
+        assert (cache.hits, cache.misses) == (3, 3)
+
+    def test_enabled_restores_functions(self, mocker):
+        """Test the slow functions are unwrapped after the block."""
+        slow_add = mocker.patch('examples.example_7.slow_add')
+
+        with OperandCache().enabled():
+            pass
+
+        from examples import example_7
+        assert example_7.slow_add is slow_add
+
+    def test_exits_in_any_order(self, mocker):
+        """Test leaving the cache before tracing unwraps only the cache."""
+        slow_add = mocker.patch(
+            'examples.example_7.slow_add', side_effect=lambda a, b: a + b,
+        )
+        mocker.patch(
+            'examples.example_7.slow_multiply', side_effect=lambda a, b: a * b,
+        )
+        cache = OperandCache()
+        buffer = RingBufferSink()
+        cache_block = cache.enabled()
+        tracing_block = tracing(buffer)
+
+        cache_block.__enter__()
+        tracing_block.__enter__()
+        cache_block.__exit__(None, None, None)
+        complex_calculation_1(2, 3)
+        complex_calculation_1(2, 3)
+        tracing_block.__exit__(None, None, None)
+
+        from examples import example_7
+        assert (cache.hits, cache.misses) == (0, 0)
+        assert slow_add.call_count == 4
+        assert len(buffer.records) == 6
+        assert example_7.slow_add is slow_add
+
+    def test_raises_for_invalid_max_size(self):
+        """Test a max_size below 1 is rejected."""
+        with pytest.raises(ValueError, match='max_size must be at least 1'):
+            OperandCache(max_size=0)
+
+
+class TestFuseCalculation:
+    """Tests for the fuse_calculation function."""
+
+    @parametrize_cases(
+        Case(
+            label='calculation_1',
+            calculation=CALCULATION_1,
+            expected='a*a + a*b + 2*a - 1',
+        ),
+        Case(
+            label='calculation_2',
+            calculation=CALCULATION_2,
+            expected='a*b + a - c',
+        ),
+    )
+    def test_expression(self, calculation, expected):
+        """Test the steps are folded into the documented closed form."""
+        assert fuse_calculation(calculation).expression == expected
+
+    @parametrize_cases(
+        Case(label='calculation_1', calculation=CALCULATION_1, args=(2, 3), expected=13),
+        Case(label='calculation_2', calculation=CALCULATION_2, args=(10, 20, 1), expected=209),
+    )
+    def test_scalar_without_slow_calls(self, mocker, calculation, args, expected):
+        """Test evaluating the fused calculation calls no step functions."""
+        slow_add = mocker.patch('examples.example_7.slow_add')
+        slow_multiply = mocker.patch('examples.example_7.slow_multiply')
+
+        actual = fuse_calculation(calculation)(*args)
+
+        assert actual == expected
+        slow_add.assert_not_called()
+        slow_multiply.assert_not_called()
+
+    def test_vectorised(self):
+        """Test arrays are evaluated element-wise."""
+        a = np.array([2, 0, -4])
+        b = [3, 0, 7]
+
+        actual = fuse_calculation(CALCULATION_1)(a, b)
+
+        np.testing.assert_array_equal(actual, [13, -1, -21])
+
+    @parametrize_cases(
+        Case(label='too_few', args=(2,)),
+        Case(label='too_many', args=(2, 3, 99)),
+    )
+    def test_raises_for_wrong_number_of_arguments(self, args):
+        """Test one argument is needed per input, as for the unfused steps."""
+        with pytest.raises(ValueError, match=r"Expected 2 arguments \('a', 'b'\)"):
+            fuse_calculation(CALCULATION_1)(*args)
+
+    def test_inputs_are_not_evaluated_as_code(self):
+        """Test input names are only labels, never compiled as Python."""
+        calculation = Calculation(
+            inputs=('__import__("os").getpid()', 'b'),
+            steps=(
+                CalculationStep('result', 'slow_multiply', ('__import__("os").getpid()', 'b')),
+            ),
+        )
+
+        fused = fuse_calculation(calculation)
+
+        assert fused(6, 7) == 42
+        assert fused.expression == '__import__("os").getpid()*b'
+
+    def test_raises_for_unknown_function(self):
+        """Test steps with no known operator cannot be fused."""
+        calculation = Calculation(
+            inputs=('a',),
+            steps=(CalculationStep('result', 'complex_calculation_1', ('a', 1)),),
+        )
+
+        with pytest.raises(ValueError, match="Cannot fuse step 'result'"):
+            fuse_calculation(calculation)
+
+
+class TestIncrementalCalculation:
+    """Tests for the IncrementalCalculation class."""
+
+    @pytest.fixture
+    def slow_functions(self, mocker):
+        """Patch the slow functions with fast ones which count their calls."""
+        return (
+            mocker.patch(
+                'examples.example_7.slow_add', side_effect=lambda a, b: a + b,
+            ),
+            mocker.patch(
+                'examples.example_7.slow_multiply', side_effect=lambda a, b: a * b,
+            ),
+        )
+
+    def test_sweeping_c_only_recomputes_tail(self, slow_functions):
+        """Test changing `c` reuses both slow steps of calculation 2."""
+        evaluator = IncrementalCalculation(CALCULATION_2)
+
+        actual = [evaluator(10, 20, c) for c in range(5)]
+
+        assert actual == [210 - c for c in range(5)]
+        assert evaluator.recomputed == ('result',)
+        assert [mock.call_count for mock in slow_functions] == [1, 1]
+
+    @parametrize_cases(
+        Case(
+            label='calculation_1_b',
+            calculation=CALCULATION_1,
+            args=(2, 3),
+            changes={'b': 4},
+            expected=15,
+            recomputed=(
+                'intermediate_step_2',
+                'intermediate_step_3',
+                'intermediate_step_4',
+                'result',
+            ),
+        ),
+        Case(
+            label='calculation_1_unchanged',
+            calculation=CALCULATION_1,
+            args=(2, 3),
+            changes={'a': 2},
+            expected=13,
+            recomputed=(),
+        ),
+        Case(
+            label='calculation_2_a',
+            calculation=CALCULATION_2,
+            args=(10, 20, 1),
+            changes={'a': 1},
+            expected=20,
+            recomputed=('intermediate_step_1', 'intermediate_step_2', 'result'),
+        ),
+    )
+    def test_update(
+        self,
+        slow_functions,
+        calculation,
+        args,
+        changes,
+        expected,
+        recomputed,
+    ):
+        """Test only the steps depending on the changed inputs are rerun."""
+        evaluator = IncrementalCalculation(calculation)
+        evaluator(*args)
+
+        actual = evaluator.update(**changes)
+
+        assert actual == expected
+        assert evaluator.recomputed == recomputed
+
+    def test_failed_step_is_retried(self, slow_functions):
+        """Test a step which raised is recomputed on the next call."""
+        slow_add, _ = slow_functions
+        evaluator = IncrementalCalculation(CALCULATION_2)
+        slow_add.side_effect = [RuntimeError('flaky'), 21]
+
+        with pytest.raises(RuntimeError, match='flaky'):
+            evaluator(1, 20, 0)
+        actual = evaluator(1, 20, 0)
+
+        assert actual == 21
+        assert evaluator.recomputed == ('intermediate_step_2', 'result')
+
+    @parametrize_cases(
+        Case(label='unknown', changes={'d': 1}, match='Unknown inputs'),
+        Case(label='missing', changes={'a': 1}, match='No value given'),
+    )
+    def test_raises_for_invalid_inputs(self, changes, match):
+        """Test inputs must be known and given at least once."""
+        evaluator = IncrementalCalculation(CALCULATION_2)
+
+        with pytest.raises(ValueError, match=match):
+            evaluator.update(**changes)
+
+
+class TestTracing:
+    """Tests for the tracing context manager and its sinks."""
+
+    @pytest.fixture
+    def slow_functions(self, mocker):
+        """Patch the slow functions with fast ones."""
+        mocker.patch('examples.example_7.slow_add', side_effect=lambda a, b: a + b)
+        mocker.patch('examples.example_7.slow_multiply', side_effect=lambda a, b: a * b)
+
+    def test_ring_buffer_records_steps(self, slow_functions):
+        """Test each slow call is recorded with its arguments and result."""
+        buffer = RingBufferSink()
+
+        with tracing(buffer):
+            complex_calculation_1(2, 3)
+
+        actual = [(step.func, step.args, step.result) for step in buffer.records]
+
+        assert actual == [
+            ('slow_add', (3, 3), 6),
+            ('slow_multiply', (6, 2), 12),
+            ('slow_add', (12, 2), 14),
+        ]
+        assert all(step.duration_ns >= 0 for step in buffer.records)
+
+    def test_ring_buffer_keeps_latest(self, slow_functions):
+        """Test the buffer drops the oldest records when full."""
+        buffer = RingBufferSink(capacity=2)
+
+        with tracing(buffer):
+            complex_calculation_1(2, 3)
+
+        assert [step.args for step in buffer.records] == [(6, 2), (12, 2)]
+
+    def test_records_errors(self, mocker):
+        """Test a failing call is recorded and the exception still raised."""
+        mocker.patch(
+            'examples.example_7.slow_multiply', side_effect=ValueError('boom'),
+        )
+        buffer = RingBufferSink()
+
+        with pytest.raises(ValueError, match='boom'), tracing(buffer):
+            complex_calculation_2(1, 2, 3)
+
+        [step] = buffer.records
+        assert step.result is None
+        assert step.error == "ValueError('boom')"
+
+    def test_no_records_outside_block(self, slow_functions):
+        """Test calls after the block are not traced."""
+        buffer = RingBufferSink()
+
+        with tracing(buffer):
+            pass
+        complex_calculation_2(1, 2, 3)
+
+        assert not buffer.records
+
+    def test_jsonl_sink(self, slow_functions, tmp_path):
+        """Test one JSON line is written per step."""
+        path = tmp_path / 'steps.jsonl'
+
+        with tracing(JsonlSink(path)):
+            complex_calculation_2(10, 20, 1)
+
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [(line['func'], line['result']) for line in lines] == [
+            ('slow_multiply', 200),
+            ('slow_add', 210),
+        ]
+
+    def test_chrome_trace_sink(self, slow_functions, tmp_path):
+        """Test complete events are written in the trace event format."""
+        path = tmp_path / 'trace.json'
+
+        with tracing(ChromeTraceSink(path)):
+            complex_calculation_2(10, 20, 1)
+
+        events = json.loads(path.read_text())['traceEvents']
+        assert [event['name'] for event in events] == ['slow_multiply', 'slow_add']
+        assert all(event['ph'] == 'X' for event in events)
+        assert events[0]['args']['args'] == [10, 20]
+
+
+class TestSingleFlight:
+    """Tests for the SingleFlight class."""
+
+    @pytest.fixture
+    def gated_add(self):
+        """A function which blocks until released, counting its calls."""
+        release = threading.Event()
+
+        def add(a, b):
+            release.wait(timeout=5)
+            return a + b
+
+        return mock.Mock(side_effect=add), release
+
+    def test_identical_calls_share_one_execution(self, gated_add):
+        """Test concurrent identical calls run the function once."""
+        add, release = gated_add
+        coalesced = SingleFlight().wrap('add', add)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(coalesced, 1, 2) for _ in range(8)]
+            sleep(0.1)
+            release.set()
+            actual = [future.result() for future in futures]
+
+        assert actual == [3] * 8
+        assert add.call_count == 1
+
+    def test_different_calls_are_not_shared(self, gated_add):
+        """Test calls with different arguments each run."""
+        add, release = gated_add
+        release.set()
+        coalesced = SingleFlight().wrap('add', add)
+
+        actual = [coalesced(1, 2), coalesced(2, 3), coalesced(1, 2)]
+
+        assert actual == [3, 5, 3]
+        assert add.call_count == 3
+
+    def test_exception_raised_for_every_caller(self):
+        """Test every waiting caller receives the exception."""
+        release = threading.Event()
+        fail = mock.Mock(side_effect=lambda: release.wait(5) and 1 / 0)
+        coalesced = SingleFlight().wrap('fail', fail)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(coalesced) for _ in range(4)]
+            sleep(0.1)
+            release.set()
+            errors = []
+            for future in futures:
+                with pytest.raises(ZeroDivisionError) as error:
+                    future.result()
+                errors.append(error.value)
+
+        assert fail.call_count == 1
+        # The caller which ran it gets the original, the others a copy each.
+        [original] = [error for error in errors if error.__cause__ is None]
+        copies = [error for error in errors if error is not original]
+        assert len({id(error) for error in copies}) == 3
+        assert all(error.__cause__ is original for error in copies)
+
+    def test_exception_copies_keep_their_type(self):
+        """Test exceptions whose __init__ differs from their args are copied."""
+        class CodedError(Exception):
+            def __init__(self, code, message):
+                super().__init__(f'{code}: {message}')
+                self.code = code
+
+        def fail():
+            release.wait(5)
+            raise CodedError(503, 'unavailable')
+
+        release = threading.Event()
+        coalesced = SingleFlight().wrap('fail', fail)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(coalesced) for _ in range(3)]
+            sleep(0.1)
+            release.set()
+            errors = [future.exception() for future in futures]
+
+        assert [type(error) for error in errors] == [CodedError] * 3
+        assert [(str(error), error.code) for error in errors] == [('503: unavailable', 503)] * 3
+
+    def test_enabled_coalesces_slow_functions(self, mocker, gated_add):
+        """Test concurrent calculations share their slow calls."""
+        add, release = gated_add
+        mocker.patch('examples.example_7.slow_add', add)
+        mocker.patch(
+            'examples.example_7.slow_multiply', side_effect=lambda a, b: a * b,
+        )
+
+        with SingleFlight().enabled(), ThreadPoolExecutor(4) as executor:
+            futures = [
+                executor.submit(complex_calculation_2, 10, 20, c)
+                for c in range(4)
+            ]
+            sleep(0.1)
+            release.set()
+            actual = [future.result() for future in futures]
+
+        assert actual == [210, 209, 208, 207]
+        assert add.call_count == 1
+
+
+class TestRunWithDeadline:
+    """Tests for the run_with_deadline function."""
+
+    @pytest.fixture
+    def clock(self, mocker):
+        """Patch the slow functions so each one takes 10 fake seconds."""
+        clock = mocker.patch('examples.example_7.monotonic', return_value=0.0)
+
+        def advance(result):
+            def step(a, b):
+                clock.return_value += 10
+                return result(a, b)
+            return step
+
+        mocker.patch('examples.example_7.slow_add', side_effect=advance(lambda a, b: a + b))
+        mocker.patch('examples.example_7.slow_multiply', side_effect=advance(lambda a, b: a * b))
+        return clock
+
+    def test_completes_within_budget(self, clock):
+        """Test the result is given when there is enough time."""
+        actual = run_with_deadline(CALCULATION_1, 2, 3, timeout=60)
+
+        assert actual.is_complete
+        assert actual.result == 13
+
+    def test_stops_between_steps(self, clock):
+        """Test the run stops once the deadline passes."""
+        actual = run_with_deadline(CALCULATION_1, 2, 3, timeout=15)
+
+        assert actual.completed_steps == (
+            'intermediate_step_1', 'intermediate_step_2', 'intermediate_step_3',
+        )
+        assert actual.remaining_steps == ('intermediate_step_4', 'result')
+        assert actual.result is None
+        assert actual.values['intermediate_step_3'] == 12
+
+    def test_cancel(self, clock):
+        """Test no steps run once cancelled."""
+        cancel = threading.Event()
+        cancel.set()
+
+        actual = run_with_deadline(CALCULATION_2, 1, 2, 3, cancel=cancel)
+
+        assert actual.completed_steps == ()
+        assert actual.values == {'a': 1, 'b': 2, 'c': 3}
+
+
+class TestResumeCalculation:
+    """Tests for the resume_calculation function."""
+
+    def test_does_not_redo_finished_steps(self, mocker):
+        """Test only the remaining steps are run."""
+        slow_add = mocker.patch('examples.example_7.slow_add', return_value=14)
+        slow_multiply = mocker.patch('examples.example_7.slow_multiply')
+        partial = PartialResult(
+            CALCULATION_1,
+            {
+                'a': 2,
+                'b': 3,
+                'intermediate_step_1': 3,
+                'intermediate_step_2': 6,
+                'intermediate_step_3': 12,
+            },
+        )
+
+        actual = resume_calculation(partial)
+
+        assert actual.result == 13
+        slow_add.assert_called_once_with(12, 2)
+        slow_multiply.assert_not_called()
+        # The original progress is left unchanged.
+        assert partial.remaining_steps == ('intermediate_step_4', 'result')
+
+    def test_failed_step_keeps_finished_values(self, mocker):
+        """Test a failing step stops the run without losing earlier steps."""
+        error = ConnectionError('lost')
+        mocker.patch('examples.example_7.slow_add', side_effect=lambda a, b: a + b)
+        slow_multiply = mocker.patch(
+            'examples.example_7.slow_multiply', side_effect=[error, 12],
+        )
+        partial = PartialResult(CALCULATION_1, {'a': 2, 'b': 3})
+
+        failed = resume_calculation(partial)
+
+        assert failed.error is error
+        assert failed.completed_steps == ('intermediate_step_1', 'intermediate_step_2')
+
+        actual = resume_calculation(failed)
+
+        assert actual.result == 13
+        assert actual.error is None
+        assert slow_multiply.call_count == 2
+
+
+@pytest.mark.skipif(
+    'fork' not in multiprocessing.get_all_start_methods(),
+    reason='patched slow functions only reach forked workers',
+)
+class TestRunCalculationsInProcesses:
+    """Tests for the run_calculations_in_processes function."""
+
+    @pytest.fixture
+    def fork(self):
+        """Multiprocessing context whose workers inherit patched functions."""
+        return multiprocessing.get_context('fork')
+
+    @pytest.fixture(autouse=True)
+    def slow_functions(self, mocker):
+        """Patch the slow functions with fast ones."""
+        mocker.patch('examples.example_7.slow_add', side_effect=lambda a, b: a + b)
+        mocker.patch('examples.example_7.slow_multiply', side_effect=lambda a, b: a * b)
+
+    @parametrize_cases(
+        Case(label='one_chunk', chunk_size=None),
+        Case(label='uneven_chunks', chunk_size=7),
+    )
+    def test_results_in_input_order(self, fork, chunk_size):
+        """Test every row is evaluated and results keep their order."""
+        arguments = np.array([(a, a % 5 - 2, a % 3) for a in range(50)])
+
+        actual = run_calculations_in_processes(
+            CALCULATION_2, arguments, max_workers=2, chunk_size=chunk_size,
+            mp_context=fork,
+        )
+
+        a, b, c = arguments.T
+        np.testing.assert_array_equal(actual, a * b + a - c)
+
+    def test_empty(self, fork):
+        """Test no inputs gives no results."""
+        actual = run_calculations_in_processes(
+            CALCULATION_1, np.empty((0, 2)), mp_context=fork,
+        )
+
+        assert actual.shape == (0,)
+
+    def test_raises_for_wrong_shape(self):
+        """Test the arguments need one column per input."""
+        with pytest.raises(ValueError, match=r'must have shape \(n, 3\)'):
+            run_calculations_in_processes(CALCULATION_2, [(1, 2)])
+
+    @parametrize_cases(
+        Case(label='negative_chunk_size', options={'chunk_size': -1}, match='chunk_size'),
+        Case(label='zero_chunk_size', options={'chunk_size': 0}, match='chunk_size'),
+        Case(label='zero_max_workers', options={'max_workers': 0}, match='max_workers'),
+    )
+    def test_raises_for_invalid_sizes(self, options, match):
+        """Test chunk sizes and worker counts below 1 are rejected."""
+        with pytest.raises(ValueError, match=f'{match} must be at least 1'):
+            run_calculations_in_processes(CALCULATION_2, [(1, 2, 3)] * 4, **options)